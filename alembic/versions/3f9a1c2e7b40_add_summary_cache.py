@@ -0,0 +1,36 @@
+"""add summary_cache table
+
+Revision ID: 3f9a1c2e7b40
+Revises: 71cf80fad9c8
+Create Date: 2026-10-17 09:12:41.220913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9a1c2e7b40'
+down_revision: Union[str, None] = '71cf80fad9c8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('summary_cache',
+    sa.Column('key', sa.String(length=64), nullable=False),
+    sa.Column('outline', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index(op.f('ix_summary_cache_expires_at'), 'summary_cache', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_summary_cache_expires_at'), table_name='summary_cache')
+    op.drop_table('summary_cache')
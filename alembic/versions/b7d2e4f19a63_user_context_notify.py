@@ -0,0 +1,53 @@
+"""notify user_context listeners on role and plan changes
+
+Revision ID: b7d2e4f19a63
+Revises: 3f9a1c2e7b40
+Create Date: 2026-10-17 10:03:12.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d2e4f19a63'
+down_revision: Union[str, None] = '3f9a1c2e7b40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # payload is the user id; see server/user_context.py
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_user_context() RETURNS trigger AS $$
+        BEGIN
+            IF TG_TABLE_NAME = 'users' THEN
+                PERFORM pg_notify('user_context', (CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END)::text);
+            ELSE
+                PERFORM pg_notify('user_context', (CASE WHEN TG_OP = 'DELETE' THEN OLD.user_id ELSE NEW.user_id END)::text);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER user_roles_notify_user_context
+        AFTER INSERT OR UPDATE OR DELETE ON user_roles
+        FOR EACH ROW EXECUTE FUNCTION notify_user_context();
+    """)
+    op.execute("""
+        CREATE TRIGGER users_notify_user_context
+        AFTER UPDATE OF subscription_plan, subscription_expires_at, active_subscriber, full_name
+              OR DELETE ON users
+        FOR EACH ROW EXECUTE FUNCTION notify_user_context();
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS users_notify_user_context ON users")
+    op.execute("DROP TRIGGER IF EXISTS user_roles_notify_user_context ON user_roles")
+    op.execute("DROP FUNCTION IF EXISTS notify_user_context()")
@@ -0,0 +1,30 @@
+"""add summarize_calls.call_id for idempotent ledger flushes
+
+Revision ID: d4a8c61e2f05
+Revises: b7d2e4f19a63
+Create Date: 2026-10-17 11:26:07.381552
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a8c61e2f05'
+down_revision: Union[str, None] = 'b7d2e4f19a63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('summarize_calls', sa.Column('call_id', sa.String(length=32), nullable=True))
+    op.create_index(op.f('ix_summarize_calls_call_id'), 'summarize_calls', ['call_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_summarize_calls_call_id'), table_name='summarize_calls')
+    op.drop_column('summarize_calls', 'call_id')
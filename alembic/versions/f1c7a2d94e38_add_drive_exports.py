@@ -0,0 +1,45 @@
+"""add drive_exports table
+
+Revision ID: f1c7a2d94e38
+Revises: e6b3f0a9c214
+Create Date: 2026-10-17 15:41:20.518302
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1c7a2d94e38'
+down_revision: Union[str, None] = 'e6b3f0a9c214'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('drive_exports',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('owner', sa.String(), nullable=False),
+    sa.Column('folder_id', sa.String(), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('file_id', sa.String(), nullable=True),
+    sa.Column('file_name', sa.String(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('http_status', sa.Integer(), nullable=True),
+    sa.Column('retry_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_drive_exports_updated_at'), 'drive_exports', ['updated_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_drive_exports_updated_at'), table_name='drive_exports')
+    op.drop_table('drive_exports')
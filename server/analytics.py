@@ -0,0 +1,92 @@
+"""
+server/analytics.py
+Batched write-behind for analytics rows (`summarize_calls` …).
+
+Records are queued in memory and written by one background task per writer
+as soon as `max_rows` are waiting, or `max_delay_ms` after the first of them
+was queued: one multi-row INSERT and one commit per batch instead of a
+transaction per event, so bursts (everyone hitting "Generate notes" as a
+lecture ends) cost a handful of WAL flushes.  A failed write keeps its rows
+queued and is retried `max_delay_ms` later; `stop()` drains the queue.
+"""
+
+import asyncio, logging
+from typing import Awaitable, Callable
+
+from server.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+ROWS    = Counter("analytics_rows_written_total", "Rows written by batched analytics writers.")
+BATCHES = Counter("analytics_batches_total", "Batches written, by writer and what triggered them (size/time/drain).")
+ERRORS  = Counter("analytics_write_errors_total", "Failed batch writes (rows stay queued and are retried).")
+
+
+class BatchWriter:
+    def __init__(
+        self,
+        name: str,
+        write: Callable[[list], Awaitable[None]],
+        *,
+        max_rows: int,
+        max_delay_ms: int,
+        max_batch: int = 1000,
+        on_written: Callable[[list], None] | None = None,
+    ):
+        self.name        = name
+        self.write       = write         # one transaction per call
+        self.max_rows    = max_rows      # queued rows that trigger a write right away
+        self.max_delay_s = max_delay_ms / 1000
+        self.max_batch   = max_batch     # rows per write (bind-parameter limits)
+        self.on_written  = on_written    # called with each batch once it is committed
+        self.queue: list = []
+        self._queued = asyncio.Event()
+        self._full   = asyncio.Event()
+        self._lock   = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    def add(self, record) -> None:
+        self.queue.append(record)
+        self._queued.set()
+        if len(self.queue) >= self.max_rows:
+            self._full.set()
+
+    async def flush(self, trigger: str = "drain") -> None:
+        async with self._lock:
+            while self.queue:
+                batch = self.queue[:self.max_batch]
+                await self.write(batch)
+                del self.queue[:len(batch)]
+                ROWS.inc(len(batch), writer=self.name)
+                BATCHES.inc(writer=self.name, trigger=trigger)
+                if self.on_written:
+                    self.on_written(batch)
+            self._queued.clear()
+            self._full.clear()
+
+    async def _run(self) -> None:
+        while True:
+            await self._queued.wait()
+            trigger = "size"
+            if not self._full.is_set():
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.max_delay_s)
+                except asyncio.TimeoutError:
+                    trigger = "time"
+            try:
+                await self.flush(trigger)
+            except Exception as e:
+                ERRORS.inc(writer=self.name)
+                logger.warning(f"{self.name} batch write failed ({e}); {len(self.queue)} rows kept for retry")
+                await asyncio.sleep(self.max_delay_s)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name=f"batch-writer-{self.name}")
+
+    async def stop(self) -> None:
+        """Stop the background task and write out what's left; raises if that fails."""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush("drain")
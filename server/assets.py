@@ -0,0 +1,127 @@
+"""
+server/assets.py
+Fingerprinted, precompressed static assets.
+
+`build()` copies every file under `static/` to `ASSET_BUILD_DIR` with a
+content hash in its name (styles.css → styles.3f9a0c1d2e4b.css), next to a
+gzip and – with the `brotli` package – a brotli copy of anything textual.
+Templates link them through `{{ asset_url("styles.css") }}`, and
+`/assets/…` serves them with `Cache-Control: immutable`: a changed file gets
+a new URL, so browsers never have to revalidate, and repeat visits download
+nothing but the page.  `PrecompressedFiles` picks the .br/.gz twin the
+client accepts, so nothing is compressed per request.
+
+The build runs once per process (on first use, or at startup) and writes
+only files that don't exist yet, so workers can share the directory and the
+Docker image can ship it prebuilt (`python -m server.assets`).  Edits to
+`static/` need a restart; old hashed files are left for pages still in
+browsers' hands.
+"""
+
+import os, gzip, hashlib, logging, threading
+from pathlib import Path
+
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+
+try:
+    import brotli
+except Exception:  # optional: gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# ── Settings ────────────────────────────────────────────────────────────────
+ASSET_SRC_DIR   = Path(os.getenv("ASSET_SRC_DIR", "static"))
+ASSET_BUILD_DIR = Path(os.getenv("ASSET_BUILD_DIR", "data/assets"))
+ASSET_URL       = "/assets"
+
+COMPRESSIBLE    = {".css", ".js", ".svg", ".ico", ".json", ".webmanifest", ".txt", ".map"}
+IMMUTABLE       = "public, max-age=31536000, immutable"
+
+
+def _write(path: Path, data: bytes) -> None:
+    if path.exists():  # content-addressed: already there means already right
+        return
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+class AssetPipeline:
+    def __init__(self, src: Path = ASSET_SRC_DIR, out: Path = ASSET_BUILD_DIR, url: str = ASSET_URL):
+        self.src, self.out, self.prefix = src, out, url
+        self._manifest: dict[str, str] | None = None  # "js/app.js" → "js/app.1a2b3c4d5e6f.js"
+        self._lock = threading.Lock()
+
+    def build(self) -> dict[str, str]:
+        manifest, written = {}, 0
+        for f in sorted(p for p in self.src.rglob("*") if p.is_file()):
+            rel  = f.relative_to(self.src)
+            data = f.read_bytes()
+            name = rel.with_name(f"{rel.stem}.{hashlib.sha256(data).hexdigest()[:12]}{rel.suffix}")
+            target = self.out / name
+            manifest[rel.as_posix()] = name.as_posix()
+            if target.exists():
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if rel.suffix in COMPRESSIBLE:
+                gz = gzip.compress(data, 9, mtime=0)
+                if len(gz) < len(data):
+                    _write(target.with_name(target.name + ".gz"), gz)
+                if brotli is not None:
+                    br = brotli.compress(data, quality=11)
+                    if len(br) < len(data):
+                        _write(target.with_name(target.name + ".br"), br)
+            _write(target, data)  # last: its presence means the twins are done
+            written += 1
+        logger.info(f"Assets: {len(manifest)} files in {self.out}, {written} new"
+                    + ("" if brotli else " (no brotli package: gzip only)"))
+        self._manifest = manifest
+        return manifest
+
+    @property
+    def manifest(self) -> dict[str, str]:
+        with self._lock:
+            if self._manifest is None:
+                self.build()
+            return self._manifest
+
+    def url(self, path: str) -> str:
+        """Template helper: the fingerprinted URL of static/`path`."""
+        name = self.manifest.get(path.lstrip("/"))
+        if name is None:
+            logger.warning(f"asset_url: no static file {path!r}")
+            return f"/static/{path.lstrip('/')}"
+        return f"{self.prefix}/{name}"
+
+
+class PrecompressedFiles(StaticFiles):
+    """StaticFiles for the fingerprinted build: .br/.gz twins when accepted, cached for good."""
+
+    async def get_response(self, path: str, scope) -> Response:
+        accepted = {
+            part.split(";")[0].strip()
+            for part in Headers(scope=scope).get("accept-encoding", "").split(",")
+        }
+        resp = None
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if encoding in accepted:
+                try:
+                    resp = await super().get_response(path + suffix, scope)
+                except HTTPException:
+                    continue
+                resp.headers["Content-Encoding"] = encoding
+                break
+        if resp is None:
+            resp = await super().get_response(path, scope)
+        resp.headers["Vary"] = "Accept-Encoding"
+        resp.headers["Cache-Control"] = IMMUTABLE
+        return resp
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    AssetPipeline().build()
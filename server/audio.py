@@ -0,0 +1,218 @@
+"""
+server/audio.py
+NumPy helpers for the STT ingest path (runs on decoding workers, not the loop).
+"""
+
+import math
+
+import numpy as np
+
+try:  # Opus uplink is optional: needs opuslib + the system libopus
+    import opuslib
+except Exception:
+    opuslib = None
+
+
+# ── Sample rates ────────────────────────────────────────────────────────────
+SUPPORTED_RATES = (8000, 11025, 16000, 22050, 24000, 32000, 44100, 48000)  # client/upload audio
+
+
+def check_rate(rate) -> int:
+    """`rate` as an int, or ValueError unless it's in SUPPORTED_RATES (the resampler's filter grows with it)."""
+    try:
+        rate = int(rate)
+    except (TypeError, ValueError):
+        rate = None
+    if rate not in SUPPORTED_RATES:
+        raise ValueError(f"Unsupported sample rate; use one of {', '.join(map(str, SUPPORTED_RATES))} Hz.")
+    return rate
+
+
+# ── Resampling ──────────────────────────────────────────────────────────────
+def _lowpass(cutoff: float, taps: int) -> np.ndarray:
+    """Hamming-windowed sinc low-pass; `cutoff` is a fraction of the input rate."""
+    n = np.arange(taps) - (taps - 1) / 2
+    h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)
+    return (h / h.sum()).astype(np.float32)
+
+
+class Resampler:
+    """
+    Streaming mono int16 resampler.
+
+    Integer ratios (48 kHz → 16 kHz) use an anti-aliasing FIR followed by
+    decimation; anything else (44.1 kHz, 8 kHz …) falls back to the same
+    filter plus linear interpolation.  Filter history and the fractional read
+    position carry over between blocks, so block boundaries are seamless.
+    """
+
+    def __init__(self, src_rate: int, dst_rate: int, taps_per_ratio: int = 16):
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+        self.passthrough = src_rate == dst_rate
+        if self.passthrough:
+            return
+
+        self._factor = src_rate // dst_rate if src_rate % dst_rate == 0 else None
+        ratio = src_rate / dst_rate
+        if ratio > 1:
+            taps = taps_per_ratio * math.ceil(ratio) + 1
+            self._h = _lowpass(0.45 / ratio, taps)  # a little under the new Nyquist
+        else:
+            self._h = None                          # upsampling: nothing to alias
+        self._hist  = np.zeros(0 if self._h is None else len(self._h) - 1, dtype=np.float32)
+        self._phase = 0                             # decimation phase
+        self._step  = ratio                         # interpolation step (input samples)
+        self._pos   = 0.0                           # next read position in the block
+        self._last  = np.float32(0)                 # previous filtered sample
+
+    def _filter(self, x: np.ndarray) -> np.ndarray:
+        if self._h is None:
+            return x
+        buf = np.concatenate((self._hist, x))
+        self._hist = buf[len(buf) - len(self._hist):]
+        return np.convolve(buf, self._h, mode="valid")
+
+    def process(self, pcm: bytes) -> bytes:
+        if self.passthrough or not pcm:
+            return pcm
+        x = np.frombuffer(pcm, dtype="<i2").astype(np.float32)
+        y = self._filter(x)
+
+        if self._factor:
+            out = y[self._phase::self._factor]
+            self._phase = (self._phase - len(y)) % self._factor
+        else:
+            n = len(y)
+            t = np.arange(self._pos, n - 1 + 1e-9, self._step) if self._pos <= n - 1 else np.empty(0)
+            out = np.interp(t, np.arange(-1, n), np.concatenate(([self._last], y)))
+            self._pos = (t[-1] + self._step if len(t) else self._pos) - n
+            self._last = y[-1]
+
+        return np.clip(np.rint(out), -32768, 32767).astype("<i2").tobytes()
+
+
+# ── Uplink codecs ───────────────────────────────────────────────────────────
+OPUS_RATES = (8_000, 12_000, 16_000, 24_000, 48_000)
+
+
+def available_codecs() -> tuple[str, ...]:
+    return ("pcm", "mulaw", "opus") if opuslib else ("pcm", "mulaw")
+
+
+def _mulaw_table() -> np.ndarray:
+    """G.711 µ-law byte → linear int16 lookup table."""
+    u = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (u >> 4) & 0x07
+    magnitude = ((((u & 0x0F) << 3) + 0x84) << exponent) - 0x84
+    return np.where(u & 0x80, -magnitude, magnitude).astype("<i2")
+
+
+_MULAW = _mulaw_table()
+
+# Opus TOC config → frame length in 48 kHz samples (RFC 6716 §3.1)
+_OPUS_FRAME = (
+    [480, 960, 1920, 2880] * 3       # SILK-only, configs 0-11
+    + [480, 960] * 2                 # hybrid, configs 12-15
+    + [120, 240, 480, 960] * 4       # CELT-only, configs 16-31
+)
+
+
+def opus_packet_seconds(packet: bytes) -> float:
+    """Audio duration of one Opus packet, read from its TOC byte."""
+    if not packet:
+        return 0.0
+    toc = packet[0]
+    code = toc & 0x03
+    frames = 1 if code == 0 else 2 if code in (1, 2) else (packet[1] & 0x3F if len(packet) > 1 else 0)
+    return frames * _OPUS_FRAME[toc >> 3] / 48_000
+
+
+class FrameDecoder:
+    """Turns uplink frames of one codec into int16 PCM at `.rate` Hz."""
+
+    def __init__(self, codec: str, sample_rate: int, prefer_rate: int):
+        if codec not in available_codecs():
+            raise ValueError(f"unsupported codec {codec!r}")
+        self.codec = codec
+        self.rate  = sample_rate
+        if codec == "opus":
+            # libopus can decode straight to the model rate – no resampling needed
+            self.rate = prefer_rate if prefer_rate in OPUS_RATES else 48_000
+            self._opus = opuslib.Decoder(self.rate, 1)
+            self._max_frame = self.rate * 120 // 1000
+
+    def decode(self, frames: list[bytes]) -> bytes:
+        if self.codec == "pcm":
+            return b"".join(frames)
+        if self.codec == "mulaw":
+            return _MULAW[np.frombuffer(b"".join(frames), dtype=np.uint8)].tobytes()
+        return b"".join(self._opus.decode(f, self._max_frame) for f in frames)
+
+
+def frame_seconds(codec: str, sample_rate: int, frame: bytes) -> float:
+    if codec == "opus":
+        return opus_packet_seconds(frame)
+    return len(frame) / (sample_rate * (2 if codec == "pcm" else 1))
+
+
+# ── Energy / silence ────────────────────────────────────────────────────────
+def frame_rms_db(pcm: np.ndarray, frame: int) -> np.ndarray:
+    """RMS level in dBFS of each whole `frame`-sample frame of int16 audio."""
+    n = len(pcm) // frame
+    x = np.asarray(pcm[:n * frame], dtype=np.float32).reshape(n, frame)
+    rms = np.sqrt(np.mean(x * x, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1.0) / 32768)
+
+
+def split_at_silence(
+    pcm: np.ndarray,
+    rate: int,
+    min_s: float = 10,
+    max_s: float = 45,
+    frame_ms: int = 30,
+    pause_ms: int = 300,
+) -> list[tuple[int, int]]:
+    """
+    Cut long int16 audio into [start, end) sample ranges of `min_s`–`max_s`
+    seconds, each cut placed in the quietest `pause_ms` stretch of its window.
+    """
+    frame = rate * frame_ms // 1000
+    db = np.concatenate([
+        frame_rms_db(pcm[i:i + frame * 10_000], frame)  # chunked: pcm may be a memmap
+        for i in range(0, len(pcm) - frame + 1, frame * 10_000)
+    ] or [np.empty(0)])
+    k = max(1, pause_ms // frame_ms)
+    quiet = np.convolve(db, np.ones(k) / k, mode="same")
+
+    lo, hi = int(min_s * 1000 / frame_ms), int(max_s * 1000 / frame_ms)
+    cuts, start = [0], 0
+    while len(db) - start > hi:
+        start += lo + int(np.argmin(quiet[start + lo:start + hi]))
+        cuts.append(start * frame)
+    cuts.append(len(pcm))
+    return [(a, b) for a, b in zip(cuts, cuts[1:]) if b > a]
+
+
+class EnergyVad:
+    """
+    Frame-energy voice-activity gate.  A block counts as speech when any
+    `frame_ms` frame in it is louder than `threshold_db`; after the last loud
+    frame the gate stays open for `hangover_ms` so word tails aren't clipped.
+    """
+
+    def __init__(self, rate: int, threshold_db: float = -45.0, hangover_ms: int = 600, frame_ms: int = 30):
+        self.rate         = rate
+        self.threshold_db = threshold_db
+        self.hangover_s   = hangover_ms / 1000
+        self._frame       = rate * frame_ms // 1000
+        self._quiet_s     = float("inf")  # start closed
+
+    def is_speech(self, pcm: bytes) -> bool:
+        samples = np.frombuffer(pcm, dtype="<i2")
+        db = frame_rms_db(samples, self._frame) if len(samples) >= self._frame else np.empty(0)
+        if (db > self.threshold_db).any():
+            self._quiet_s = 0.0
+            return True
+        self._quiet_s += len(samples) / self.rate
+        return self._quiet_s <= self.hangover_s
@@ -6,24 +6,20 @@ Asynchronous helper functions for DB access.
 import datetime, secrets
 from typing import Optional, Sequence
 import sqlalchemy as sa
-from sqlalchemy import select, update, insert, func
+from sqlalchemy import select, insert, func
 from sqlalchemy.ext.asyncio import AsyncSession
-from passlib.context import CryptContext
 
 from server.models import (
     User,
     user_roles,
     UserFeedback,
-    SummarizeCall,
     SubscriptionPlan,
     UserSubscriptionHistory,
     Role,
     EmailVerification,
     PasswordReset
 )
-
-# ── Password hashing ────────────────────────────────────────────────────────
-_pwd_ctx = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from server.passwords import hash_password, verify_password
 
 
 # ── User helpers ────────────────────────────────────────────────────────────
@@ -32,8 +28,8 @@ async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User
     return res.scalar_one_or_none()
 
 
-async def create_user(db: AsyncSession, username: str, password: str, full_name:str | None = None,) -> User:
-    hashed = _pwd_ctx.hash(password)
+async def create_user(db: AsyncSession, username: str, password: str, full_name:str | None = None, *, commit: bool = True) -> User:
+    hashed = await hash_password(password)
     user = User(
         username=username,
         hashed_password=hashed,
@@ -68,9 +64,12 @@ async def create_user(db: AsyncSession, username: str, password: str, full_name:
         insert(user_roles).values(user_id=user.id, role_id=default_role.id)
     )
 
-    # 4) one final commit
-    await db.commit()
-    await db.refresh(user)      # if you need the fresh object back
+    # 4) one final commit – unless the caller has more to add to the transaction
+    if commit:
+        await db.commit()
+        await db.refresh(user)      # if you need the fresh object back
+    else:
+        await db.flush()
 
     return user
 
@@ -79,41 +78,17 @@ async def authenticate_user(
     db: AsyncSession, username: str, password: str
 ) -> Optional[User]:
     user = await get_user_by_username(db, username)
-    if not user or not _pwd_ctx.verify(password, user.hashed_password):
+    if not user:
+        return None
+    ok, new_hash = await verify_password(password, user.hashed_password)
+    if not ok:
         return None
+    if new_hash:  # stored with an outdated work factor – upgrade it while we have the password
+        user.hashed_password = new_hash
+        await db.commit()
     return user
 
 
-# ── Usage & analytics helpers ───────────────────────────────────────────────
-async def bump_usage(
-    db: AsyncSession,
-    user_id: int,
-    transcript_len: int,
-    tokens_used: int,
-) -> None:
-    """Atomically increment usage counters and log the call."""
-    # 1) atomic UPDATE
-    await db.execute(
-        update(User)
-        .where(User.id == user_id)
-        .values(
-            summarize_call_count=User.summarize_call_count + 1,
-            last_summarize_at=datetime.datetime.now(datetime.timezone.utc),
-        )
-    )
-
-    # 2) per‑call log
-    db.add(
-        SummarizeCall(
-            user_id=user_id,
-            transcript_length=transcript_len,
-            tokens_used=tokens_used,
-        )
-    )
-
-    await db.commit()
-
-
 # ── Feedback helpers ────────────────────────────────────────────────────────
 async def store_feedback(
     db: AsyncSession, user_id: int, feedback_json: dict
@@ -163,6 +138,7 @@ async def create_verification_code(
     user_id: int,
     *,
     ttl_minutes: int = 1440,
+    commit: bool = True,
 ) -> str:
     # 1) Expire any previous codes
     await db.execute(
@@ -184,7 +160,8 @@ async def create_verification_code(
         expires_at=datetime.datetime.utcnow() + datetime.timedelta(minutes=ttl_minutes)
     )
     db.add(ev)
-    await db.commit()
+    if commit:  # else the caller commits it, with the mail carrying the code
+        await db.commit()
     return code
 
 async def confirm_code(
@@ -227,7 +204,8 @@ async def create_password_reset_code(
     email: str,
     user_id: int,
     *,
-    ttl_minutes: int = 60
+    ttl_minutes: int = 60,
+    commit: bool = True,
 ) -> str:
     # expire any previous
     await db.execute(
@@ -249,7 +227,8 @@ async def create_password_reset_code(
                  datetime.timedelta(minutes=ttl_minutes),
     )
     db.add(pr)
-    await db.commit()
+    if commit:
+        await db.commit()
     return code
 
 async def confirm_password_reset_code(
@@ -277,7 +256,7 @@ async def confirm_password_reset_code(
     return row.user_id
 
 async def update_user_password(db: AsyncSession, user_id: int, new_password: str):
-    hashed = _pwd_ctx.hash(new_password)
+    hashed = await hash_password(new_password)
     await db.execute(
       sa.update(User)
         .where(User.id==user_id)
@@ -0,0 +1,373 @@
+"""
+server/drive.py
+Google Drive uploads for /save-to-drive.
+
+The Drive API `Resource` is built once per process – parsing the discovery
+document took longer than many uploads – and each request is executed with
+the caller's access token over that thread's own `httplib2.Http`, so
+connections to googleapis.com are reused between saves.  The blocking HTTP
+calls run on `DRIVE_WORKERS` dedicated threads, never on the event loop, so
+a wave of saves at the end of a lecture doesn't stall live transcription.
+
+/save-to-drive doesn't wait for Google either: it queues a `DriveExportJob`
+and returns its id.  `DRIVE_WORKERS` tasks work the queue; uploads that hit
+Drive rate limits (429, 403 rateLimitExceeded), 5xx or network errors are
+retried up to `DRIVE_RETRIES` times with jittered exponential backoff (or
+Retry-After, when Drive sends one).
+
+A failure can come after Drive already made the Doc – a read timeout, a
+reset, a 5xx.  Every upload is therefore tagged with its job id in
+`appProperties`, and a retry after such an error first looks for a file with
+that tag: a Doc whose response got lost is reported, not created twice.
+Only 429s and rate-limit 403s, which Drive refuses before doing anything,
+skip the look-up.
+
+The upload runs in the worker that took the request, but its progress is
+written to `drive_exports`, so GET /save-to-drive/{job_id} works on every
+worker.  The worker renews its unfinished rows every `DRIVE_LEASE_S / 3`
+seconds; one not renewed for `DRIVE_LEASE_S` belonged to a worker that died
+or was redeployed, and is reported – and, by the next sweep, stored – as an
+interrupted error.  A worker that shuts down cleanly marks its own at once.
+Rows are deleted `DRIVE_JOB_TTL_S` after their last change.
+"""
+
+import os, json, time, uuid, random, asyncio, logging, datetime, threading
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import httplib2
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from server.db import AsyncSessionLocal
+from server.models import DriveExport
+
+logger = logging.getLogger(__name__)
+
+# ── Settings ────────────────────────────────────────────────────────────────
+DRIVE_WORKERS       = int(os.getenv("DRIVE_WORKERS", 4))          # uploads in flight per process
+DRIVE_TIMEOUT_S     = int(os.getenv("DRIVE_TIMEOUT_S", 120))      # per HTTP call
+DRIVE_RETRIES       = int(os.getenv("DRIVE_RETRIES", 5))          # after the first attempt
+DRIVE_BACKOFF_S     = float(os.getenv("DRIVE_BACKOFF_S", 1))      # first retry delay, doubled each time…
+DRIVE_BACKOFF_MAX_S = float(os.getenv("DRIVE_BACKOFF_MAX_S", 60)) # …up to this
+DRIVE_QUEUE_MAX     = int(os.getenv("DRIVE_QUEUE_MAX", 500))      # unfinished jobs, then 503
+DRIVE_JOB_TTL_S     = int(os.getenv("DRIVE_JOB_TTL_S", 3600))     # keep jobs this long after their last change
+DRIVE_LEASE_S       = int(os.getenv("DRIVE_LEASE_S", 90))         # unfinished rows not renewed this long are dead
+
+RESUMABLE_MIN_BYTES = 5 * 1024 * 1024  # smaller files go up in one multipart request
+RETRY_STATUSES      = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS  = {"rateLimitExceeded", "userRateLimitExceeded"}  # Drive's 403 flavour of 429
+EXPORT_PROPERTY     = "lab12ExportId"  # appProperties key tagging each upload with its job id
+
+_executor = ThreadPoolExecutor(DRIVE_WORKERS, thread_name_prefix="drive")
+_local    = threading.local()
+_lock     = threading.Lock()
+_service  = None
+
+
+def _drive():
+    """The shared Drive v3 resource; requests built from it are executed with a per-call `http`."""
+    global _service
+    with _lock:
+        if _service is None:
+            _service = build("drive", "v3", http=httplib2.Http(timeout=DRIVE_TIMEOUT_S), cache_discovery=False)
+        return _service
+
+
+def _http(access_token: str) -> AuthorizedHttp:
+    # httplib2.Http isn't thread-safe, but keeps its connections open: one per thread
+    if not hasattr(_local, "http"):
+        _local.http = httplib2.Http(timeout=DRIVE_TIMEOUT_S)
+    return AuthorizedHttp(Credentials(token=access_token), http=_local.http)
+
+
+def find_export(http, export_id: str) -> dict | None:
+    """Blocking: the file an earlier upload tagged with `export_id`, if Drive has it."""
+    query = f"appProperties has {{ key='{EXPORT_PROPERTY}' and value='{export_id}' }} and trashed = false"
+    files = _drive().files().list(q=query, fields="files(id,name)", pageSize=1).execute(http=http)
+    return (files.get("files") or [None])[0]
+
+
+def upload_html(
+    access_token: str, html: str, name: str, folder_id: str,
+    export_id: str | None = None, look_first: bool = False,
+) -> dict:
+    """Blocking: import `html` into `folder_id` as a Google Doc.  Returns {"id", "name"}.
+
+    With `export_id` the file is tagged with it, and `look_first` returns an
+    already tagged file instead of uploading again.
+    """
+    http = _http(access_token)
+    if export_id and look_first:
+        found = find_export(http, export_id)
+        if found:
+            return found
+    body = html.encode("utf-8")
+    file_metadata = {
+        "name": name,
+        "mimeType": "application/vnd.google-apps.document",  # Drive converts the HTML
+        "parents": [folder_id],
+    }
+    if export_id:
+        file_metadata["appProperties"] = {EXPORT_PROPERTY: export_id}
+    media = MediaIoBaseUpload(BytesIO(body), mimetype="text/html", resumable=len(body) >= RESUMABLE_MIN_BYTES)
+    request = _drive().files().create(body=file_metadata, media_body=media, fields="id,name")
+    return request.execute(http=http)
+
+
+async def save_html(
+    access_token: str, html: str, name: str, folder_id: str,
+    export_id: str | None = None, look_first: bool = False,
+) -> dict:
+    """`upload_html` on the Drive threads.  Raises `googleapiclient.errors.HttpError`."""
+    return await asyncio.get_running_loop().run_in_executor(
+        _executor, upload_html, access_token, html, name, folder_id, export_id, look_first
+    )
+
+
+def shutdown() -> None:
+    _executor.shutdown(wait=False, cancel_futures=True)
+
+
+# ── Export jobs ─────────────────────────────────────────────────────────────
+class ExportQueueFull(RuntimeError):
+    pass
+
+
+class ExportStatusUnavailable(RuntimeError):
+    pass
+
+
+INTERRUPTED = "The export was interrupted by a server restart, please try again."
+
+
+def _utc(ts: float | None) -> datetime.datetime | None:
+    return None if ts is None else datetime.datetime.fromtimestamp(ts, datetime.timezone.utc)
+
+
+@dataclass
+class DriveExportJob:
+    id: str
+    owner: str
+    access_token: str
+    html: str
+    name: str
+    folder_id: str
+    status: str = "queued"             # queued → uploading (→ retrying → uploading)* → done | error
+    attempts: int = 0
+    look_first: bool = False           # an earlier attempt may have created the Doc already
+    file_id: str | None = None
+    file_name: str | None = None
+    error: str | None = None
+    http_status: int | None = None     # of the final Drive error
+    retry_at: float | None = None      # wall clock, like the other times: they go to the DB
+    created: float = field(default_factory=time.time)
+    finished: float | None = None
+
+    @classmethod
+    def from_row(cls, row: DriveExport) -> "DriveExportJob":
+        """A status-only copy of another worker's job."""
+        return cls(
+            row.id, row.owner, "", "", "", row.folder_id, row.status, row.attempts,
+            file_id=row.file_id, file_name=row.file_name, error=row.error, http_status=row.http_status,
+            retry_at=row.retry_at.timestamp() if row.retry_at else None,
+            created=row.created_at.timestamp(),
+            finished=row.finished_at.timestamp() if row.finished_at else None,
+        )
+
+    def row(self) -> dict:
+        return dict(
+            id=self.id, owner=self.owner, folder_id=self.folder_id, status=self.status,
+            attempts=self.attempts, file_id=self.file_id, file_name=self.file_name,
+            error=self.error, http_status=self.http_status, retry_at=_utc(self.retry_at),
+            created_at=_utc(self.created), finished_at=_utc(self.finished),
+            updated_at=datetime.datetime.now(datetime.timezone.utc),
+        )
+
+    def public(self) -> dict:
+        out = {"job_id": self.id, "status": self.status, "attempts": self.attempts, "folder_id": self.folder_id}
+        if self.status == "done":
+            out.update(file_id=self.file_id, file_name=self.file_name)
+        if self.status == "retrying" and self.retry_at:
+            out["retry_in_s"] = round(max(0.0, self.retry_at - time.time()), 1)
+        if self.error:
+            out["error"] = self.error
+        return out
+
+
+def _rate_limited(error: Exception) -> bool:
+    """Drive turned the request away before acting on it."""
+    if not isinstance(error, HttpError):
+        return False
+    status = error.resp.status if error.resp else 0
+    reasons = {d.get("reason") for d in (error.error_details or []) if isinstance(d, dict)}
+    return status == 429 or (status == 403 and bool(reasons & RATE_LIMIT_REASONS))
+
+
+def _retry_after(error: Exception) -> float | None:
+    """Seconds to wait before retrying `error`, None if it isn't worth a retry."""
+    if isinstance(error, HttpError):
+        status = error.resp.status if error.resp else 0
+        if status not in RETRY_STATUSES and not _rate_limited(error):
+            return None
+        try:
+            return float(error.resp.get("retry-after"))
+        except (TypeError, ValueError):
+            return 0.0
+    if isinstance(error, (httplib2.HttpLib2Error, OSError)):  # timeouts, resets, DNS
+        return 0.0
+    return None
+
+
+def describe(error: HttpError) -> str:
+    """Google's own message when it sent one."""
+    try:
+        return f"Google Drive Error: {json.loads(error.content.decode('utf-8'))['error']['message']}"
+    except Exception:
+        return f"Google Drive API error: {error.resp.status} {error.reason}"
+
+
+class DriveExporter:
+    def __init__(self, workers: int = DRIVE_WORKERS):
+        self.workers = workers
+        self._jobs: dict[str, DriveExportJob] = {}  # this worker's, with what it takes to upload them
+        self._queue: asyncio.Queue[DriveExportJob] = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+        self._purged = 0.0
+
+    def start(self) -> None:
+        self._tasks = [
+            asyncio.create_task(self._work(), name=f"drive-export-{i}") for i in range(self.workers)
+        ]
+        self._tasks.append(asyncio.create_task(self._keep_leases(), name="drive-export-leases"))
+
+    async def _keep_leases(self) -> None:
+        """Renew this worker's unfinished rows; fail those whose worker stopped renewing them."""
+        while True:
+            now = datetime.datetime.now(datetime.timezone.utc)
+            mine = [job.id for job in self._jobs.values() if not job.finished]
+            try:
+                async with AsyncSessionLocal() as db:
+                    if mine:
+                        await db.execute(update(DriveExport).where(DriveExport.id.in_(mine)).values(updated_at=now))
+                    await db.execute(
+                        update(DriveExport)
+                        .where(
+                            DriveExport.finished_at.is_(None),
+                            DriveExport.updated_at < now - datetime.timedelta(seconds=DRIVE_LEASE_S),
+                        )
+                        .values(status="error", error=INTERRUPTED, retry_at=None, finished_at=now, updated_at=now)
+                    )
+                    await db.commit()
+            except Exception as e:
+                logger.warning(f"Could not renew Drive export leases: {e}")
+            await asyncio.sleep(DRIVE_LEASE_S / 3)
+
+    async def _save(self, job: DriveExportJob) -> None:
+        """Publish `job`'s progress to the other workers; the upload goes on if the DB is away."""
+        values = job.row()
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    insert(DriveExport).values(**values)
+                    .on_conflict_do_update(index_elements=["id"], set_=values)
+                )
+                await db.commit()
+        except Exception as e:
+            logger.warning(f"Drive export {job.id}: could not store status {job.status!r}: {e}")
+
+    async def _purge(self) -> None:
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and now - job.finished > DRIVE_JOB_TTL_S:
+                del self._jobs[job_id]
+        if now - self._purged < 60:
+            return
+        self._purged = now
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(delete(DriveExport).where(DriveExport.updated_at < _utc(now - DRIVE_JOB_TTL_S)))
+                await db.commit()
+        except Exception as e:
+            logger.warning(f"Could not purge old Drive exports: {e}")
+
+    async def submit(self, owner: str, access_token: str, html: str, name: str, folder_id: str) -> DriveExportJob:
+        await self._purge()
+        if sum(1 for job in self._jobs.values() if not job.finished) >= DRIVE_QUEUE_MAX:
+            raise ExportQueueFull("Too many Drive exports in progress, please try again shortly.")
+        job = DriveExportJob(uuid.uuid4().hex, owner, access_token, html, name, folder_id)
+        self._jobs[job.id] = job
+        await self._save(job)
+        self._queue.put_nowait(job)
+        return job
+
+    async def get(self, job_id: str, owner: str) -> DriveExportJob | None:
+        """This worker's job, else another's from the DB.  Raises ExportStatusUnavailable without one."""
+        job = self._jobs.get(job_id)
+        if job is None:
+            try:
+                async with AsyncSessionLocal() as db:
+                    row = await db.scalar(select(DriveExport).where(DriveExport.id == job_id))
+            except Exception as e:
+                logger.warning(f"Could not look up Drive export {job_id}: {e}")
+                raise ExportStatusUnavailable("Export status is unavailable right now, please try again shortly.")
+            job = DriveExportJob.from_row(row) if row else None
+            if job and not job.finished and time.time() - row.updated_at.timestamp() > DRIVE_LEASE_S:
+                job.status, job.error, job.retry_at = "error", INTERRUPTED, None  # stored by the next sweep
+        return job if job and job.owner == owner else None
+
+    async def _finish(self, job: DriveExportJob, status: str) -> None:
+        job.status, job.finished, job.retry_at = status, time.time(), None
+        job.access_token = job.html = ""  # nothing to keep around once it's over
+        await self._save(job)
+
+    async def _work(self) -> None:
+        while True:
+            job = await self._queue.get()
+            job.status = "uploading"
+            job.attempts += 1
+            await self._save(job)
+            try:
+                file = await save_html(job.access_token, job.html, job.name, job.folder_id, job.id, job.look_first)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await self._failed(job, e)
+            else:
+                job.file_id, job.file_name = file.get("id"), file.get("name")
+                await self._finish(job, "done")
+                logger.info(f"Drive export {job.id}: '{job.file_name}' ({job.file_id}) created for {job.owner}")
+
+    async def _failed(self, job: DriveExportJob, error: Exception) -> None:
+        wait = _retry_after(error)
+        if wait is not None and job.attempts <= DRIVE_RETRIES:
+            backoff = min(DRIVE_BACKOFF_MAX_S, DRIVE_BACKOFF_S * 2 ** (job.attempts - 1))
+            delay = max(wait, backoff * random.uniform(0.5, 1.0))  # jitter spreads synchronized retries
+            job.look_first = job.look_first or not _rate_limited(error)
+            job.status, job.retry_at = "retrying", time.time() + delay
+            logger.warning(f"Drive export {job.id} attempt {job.attempts} failed ({error}); retrying in {delay:.1f}s")
+            asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, job)
+            await self._save(job)
+            return
+
+        if isinstance(error, HttpError):
+            job.error, job.http_status = describe(error), error.resp.status if error.resp else None
+            logger.error(f"Drive export {job.id} for {job.owner} failed: {error}")
+        else:
+            job.error = "Unexpected error saving to Drive."
+            logger.error(f"Drive export {job.id} for {job.owner} failed: {error}", exc_info=error)
+        await self._finish(job, "error")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for job in [job for job in self._jobs.values() if not job.finished]:
+            job.error = INTERRUPTED
+            await self._finish(job, "error")
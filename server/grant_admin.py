@@ -5,10 +5,11 @@ import argparse
 from dotenv import load_dotenv
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import select
+from sqlalchemy import select, func
 from sqlalchemy.dialects.postgresql import insert
 
 from server.models import User, Role, user_roles
+from server.user_context import USER_CONTEXT_CHANNEL
 
 def get_database_url() -> str:
     """Load DATABASE_URL from .env and return it."""
@@ -46,6 +47,9 @@ async def grant_admin_role(username: str) -> None:
             .on_conflict_do_nothing(index_elements=["user_id", "role_id"])
         )
         await session.execute(stmt)
+        # running servers drop their cached user context (the user_roles trigger
+        # does the same; this covers databases without that migration)
+        await session.execute(select(func.pg_notify(USER_CONTEXT_CHANNEL, str(user.id))))
         await session.commit()
         print(f"Granted 'admin' role to user '{username}'")
 
@@ -0,0 +1,305 @@
+"""
+server/ledger.py
+Summarize quota, counted in memory and written behind to Postgres.
+
+A /summarize call *reserves* one call before it talks to OpenAI (a dict
+lookup, no query), then either *charges* the reservation or releases it when
+the call fails.  Charges are appended to a local journal and written behind
+by a `BatchWriter` – once `LEDGER_FLUSH_ROWS` are waiting or after
+`LEDGER_FLUSH_MS` – in one transaction that inserts their `summarize_calls`
+rows and bumps `users.summarize_call_count` / `last_summarize_at`, so the
+database is off the critical path of every summarize call.
+
+What a user has used is their user-context snapshot plus the charges that
+snapshot can't have seen yet: those still pending here, and those flushed
+after it was loaded.  Each worker keeps its own ledger; what other workers
+charge shows up once their flushes reach this worker's user contexts.
+
+Crash safety: every charge carries a `call_id`, unique in `summarize_calls`.
+Flushes insert with ON CONFLICT DO NOTHING and only count rows that were
+new, so replaying a journal twice never bills a call twice.  On startup each
+worker replays the journals no live worker holds a lock on (i.e. left behind
+by a crash) and deletes them; a worker whose replay fails keeps retrying it,
+but never runs without a journal of its own.  Journals survive the process dying; set
+`LEDGER_FSYNC=1` for them to survive the machine dying too.
+"""
+
+import os, json, glob, time, fcntl, asyncio, secrets, logging, datetime
+
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from server.db import AsyncSessionLocal
+from server.analytics import BatchWriter
+from server.metrics import Gauge
+from server.models import SummarizeCall, User
+from server.user_context import USER_CONTEXT_TTL_S, UserContext
+
+logger = logging.getLogger(__name__)
+
+# ── Settings ────────────────────────────────────────────────────────────────
+LEDGER_DIR               = os.getenv("LEDGER_DIR", "data/ledger")              # journals, one per worker
+LEDGER_FLUSH_MS          = int(os.getenv("LEDGER_FLUSH_MS", 1000))             # longest a charge waits to be written
+LEDGER_FLUSH_ROWS        = int(os.getenv("LEDGER_FLUSH_ROWS", 200))            # ... unless this many are waiting
+LEDGER_FLUSH_MAX         = int(os.getenv("LEDGER_FLUSH_MAX", 1000))            # rows per transaction
+LEDGER_RESERVATION_TTL_S = int(os.getenv("LEDGER_RESERVATION_TTL_S", 600))     # forgotten reservations lapse
+LEDGER_FSYNC             = os.getenv("LEDGER_FSYNC", "0") == "1"
+LEDGER_RECOVER_RETRY_S   = int(os.getenv("LEDGER_RECOVER_RETRY_S", 60))        # after a failed journal replay
+
+
+class _Account:
+    """One user's calls this worker knows about beyond their user context."""
+
+    __slots__ = ("pending", "flushed", "held")
+
+    def __init__(self):
+        self.pending = 0                   # charged, not in the database yet
+        self.flushed: list[float] = []     # monotonic times recent charges were committed
+        self.held: dict[str, float] = {}   # reservation id -> expiry
+
+    def used(self, user: UserContext) -> int:
+        unseen = sum(1 for t in self.flushed if t >= user.loaded_at)
+        return user.summarize_call_count + self.pending + unseen
+
+    def prune(self, now: float) -> None:
+        horizon = now - USER_CONTEXT_TTL_S - 60  # older than any snapshot still in use
+        self.flushed = [t for t in self.flushed if t >= horizon]
+        for rid, expires in list(self.held.items()):
+            if expires < now:
+                del self.held[rid]
+
+    def idle(self) -> bool:
+        return not (self.pending or self.flushed or self.held)
+
+
+class Reservation:
+    """One summarize call on account.  `async with` releases it unless it was charged."""
+
+    def __init__(self, ledger: "QuotaLedger", user: UserContext, rid: str):
+        self.ledger = ledger
+        self.user   = user
+        self.id     = rid
+        self.done   = False
+        self.kept   = False  # someone other than the dependency that took it will release it
+
+    def keep(self) -> None:
+        """Take releasing it over from `quota.enforce_quota` (e.g. for a streaming response)."""
+        self.kept = True
+
+    def charge(self, transcript_len: int, tokens_used: int) -> None:
+        if not self.done:
+            self.done = True
+            self.ledger._charge(self, transcript_len, tokens_used)
+
+    def release(self) -> None:
+        if not self.done:
+            self.done = True
+            self.ledger._release(self)
+
+    async def __aenter__(self) -> "Reservation":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.release()
+
+
+class QuotaLedger:
+    def __init__(self, directory: str = LEDGER_DIR, flush_ms: int = LEDGER_FLUSH_MS,
+                 flush_rows: int = LEDGER_FLUSH_ROWS, reservation_ttl_s: int = LEDGER_RESERVATION_TTL_S):
+        self.directory         = directory
+        self.reservation_ttl_s = reservation_ttl_s
+        self._accounts: dict[int, _Account] = {}
+        self._journal = None
+        self._journal_path: str | None = None
+        self._recovery: asyncio.Task | None = None
+        # its queue holds the charges not yet written, in journal order
+        self._writer = BatchWriter(
+            "summarize_calls", write_calls,
+            max_rows=flush_rows, max_delay_ms=flush_ms, max_batch=LEDGER_FLUSH_MAX,
+            on_written=self._written,
+        )
+        Gauge("quota_ledger_pending", "Charged summarize calls not yet written to the database.",
+              lambda: len(self._writer.queue))
+
+    # ── quota ──────────────────────────────────────────────────────────────
+    def used(self, user: UserContext) -> int:
+        acct = self._accounts.get(user.id)
+        return acct.used(user) if acct else user.summarize_call_count
+
+    def reserve(self, user: UserContext, limit: int | None) -> Reservation | None:
+        """A reservation, or None when `limit` (None = unlimited) is used up."""
+        now = time.monotonic()
+        acct = self._accounts.setdefault(user.id, _Account())
+        acct.prune(now)
+        if limit is not None and acct.used(user) + len(acct.held) >= limit:
+            return None
+        rid = secrets.token_hex(16)
+        acct.held[rid] = now + self.reservation_ttl_s
+        return Reservation(self, user, rid)
+
+    def _release(self, res: Reservation) -> None:
+        acct = self._accounts.get(res.user.id)
+        if acct:
+            acct.held.pop(res.id, None)
+
+    def _charge(self, res: Reservation, transcript_len: int, tokens_used: int) -> None:
+        acct = self._accounts.setdefault(res.user.id, _Account())
+        acct.held.pop(res.id, None)
+        acct.pending += 1
+        record = {
+            "call_id": res.id,
+            "user_id": res.user.id,
+            "called_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "transcript_length": transcript_len,
+            "tokens_used": tokens_used,
+        }
+        if self._journal:
+            try:
+                self._journal.write(json.dumps(record) + "\n")
+                self._journal.flush()
+                if LEDGER_FSYNC:
+                    os.fsync(self._journal.fileno())
+            except OSError as e:
+                logger.error(f"Quota ledger journal write failed: {e}")
+        self._writer.add(record)
+
+    # ── write-behind ───────────────────────────────────────────────────────
+    def _written(self, batch: list[dict]) -> None:
+        now = time.monotonic()
+        for record in batch:
+            acct = self._accounts.setdefault(record["user_id"], _Account())
+            acct.pending -= 1
+            acct.flushed.append(now)
+        self._rewrite_journal()
+
+        for user_id, acct in list(self._accounts.items()):
+            acct.prune(now)
+            if acct.idle():
+                del self._accounts[user_id]
+
+    def _rewrite_journal(self) -> None:
+        """Journal := what's still queued (usually nothing)."""
+        if not self._journal:
+            return
+        try:
+            self._journal.truncate(0)
+            self._journal.write("".join(json.dumps(r) + "\n" for r in self._writer.queue))
+            self._journal.flush()
+            if LEDGER_FSYNC:
+                os.fsync(self._journal.fileno())
+        except OSError as e:
+            logger.error(f"Quota ledger journal rewrite failed: {e}")
+
+    # ── lifecycle ──────────────────────────────────────────────────────────
+    async def start(self) -> None:
+        # no journal, no start: charges waiting for a flush would die with the process
+        os.makedirs(self.directory, exist_ok=True)
+        self._open_journal()
+        try:
+            await self._recover()
+        except Exception as e:
+            # the journals stay where they are (replaying twice is harmless): try again later
+            logger.error(f"Quota ledger replay failed ({e}); retrying every {LEDGER_RECOVER_RETRY_S}s")
+            self._recovery = asyncio.create_task(self._retry_recover(), name="quota-ledger-recovery")
+        self._writer.start()
+
+    async def _retry_recover(self) -> None:
+        while True:
+            await asyncio.sleep(LEDGER_RECOVER_RETRY_S)
+            try:
+                await self._recover()
+                return
+            except Exception as e:
+                logger.warning(f"Quota ledger replay failed again: {e}")
+
+    def _open_journal(self) -> None:
+        # locked under a name _recover() ignores, then renamed: no other worker can
+        # take a fresh journal for a crashed one
+        path = os.path.join(self.directory, f"{os.getpid()}-{secrets.token_hex(4)}")
+        journal = open(path + ".tmp", "a")
+        fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        os.rename(path + ".tmp", path + ".jsonl")
+        self._journal, self._journal_path = journal, path + ".jsonl"
+
+    async def _recover(self) -> None:
+        for path in glob.glob(os.path.join(self.directory, "*.jsonl")):
+            try:
+                journal = open(path)
+            except FileNotFoundError:
+                continue                       # recovered by another worker meanwhile
+            with journal:
+                try:
+                    fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue                   # a live worker's journal
+                records = []
+                for line in journal:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        pass                   # torn last line of a crash
+                for i in range(0, len(records), LEDGER_FLUSH_MAX):
+                    await write_calls(records[i:i + LEDGER_FLUSH_MAX])
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            if records:
+                logger.info(f"Quota ledger recovered {len(records)} calls from {path}")
+
+    async def stop(self) -> None:
+        if self._recovery:
+            self._recovery.cancel()
+            await asyncio.gather(self._recovery, return_exceptions=True)
+        try:
+            await self._writer.stop()
+        except Exception as e:
+            logger.error(f"Quota ledger final flush failed ({e}); {len(self._writer.queue)} calls left in the journal")
+        if self._journal:
+            self._journal.close()
+            if not self._writer.queue:
+                os.remove(self._journal_path)
+            self._journal = None
+
+
+async def write_calls(records: list[dict]) -> None:
+    """
+    Insert `summarize_calls` rows and bump the users' counters, in one
+    transaction.  Idempotent: calls already in the table are not counted again.
+    """
+    async with AsyncSessionLocal() as db:
+        user_ids = {r["user_id"] for r in records}
+        known = set((await db.scalars(select(User.id).where(User.id.in_(user_ids)))).all())
+        rows = [
+            {**r, "called_at": datetime.datetime.fromisoformat(r["called_at"])}
+            for r in records if r["user_id"] in known  # deleted users would fail the whole batch
+        ]
+        if not rows:
+            return
+        inserted = (await db.execute(
+            insert(SummarizeCall)
+            .values(rows)
+            .on_conflict_do_nothing(index_elements=["call_id"])
+            .returning(SummarizeCall.user_id, SummarizeCall.called_at)
+        )).all()
+
+        per_user: dict[int, tuple[int, datetime.datetime]] = {}
+        for user_id, called_at in inserted:
+            n, last = per_user.get(user_id, (0, called_at))
+            per_user[user_id] = (n + 1, max(last, called_at))
+        if per_user:
+            # one executemany round trip; rows locked in id order so concurrent
+            # flushes from other workers can't deadlock with this one
+            await db.execute(
+                update(User)
+                .where(User.id == bindparam("b_id"))
+                .values(
+                    summarize_call_count=func.coalesce(User.summarize_call_count, 0) + bindparam("b_n"),
+                    last_summarize_at=func.greatest(User.last_summarize_at, bindparam("b_last")),
+                ),
+                [{"b_id": uid, "b_n": n, "b_last": last} for uid, (n, last) in sorted(per_user.items())],
+            )
+        await db.commit()
+
+
+quota_ledger = QuotaLedger()
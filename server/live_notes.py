@@ -0,0 +1,186 @@
+"""
+server/live_notes.py
+Rolling notes built while a /ws/stt session is recording (opt-in).
+
+Final `{"text": ...}` segments are gathered into windows of about
+`LIVE_NOTES_WINDOW_TOKENS`; each full window is condensed in the background
+with the same per-chunk prompt /summarize uses for long transcripts.  When
+the user hits "Generate notes" and the transcript they send is still exactly
+what the session heard, only the final merge over the partial notes (plus the
+short tail that never filled a window) is left to do, so its latency no
+longer grows with the length of the lecture.  Edited or restored transcripts
+don't match and take the normal path.
+
+The background calls are spent before anyone asked for notes, so they are
+fenced in: opting in needs quota left and passes the `LIVE_NOTES_RATE_LIMIT`
+rate limit, at most `LIVE_NOTES_MAX_WINDOWS` windows per recording run in the
+background (later ones are condensed at /summarize time, on that call's
+quota), and they run in their own pool of `LIVE_NOTES_CONCURRENCY` calls
+rather than the one interactive summaries use.  Their tokens are billed with
+the /summarize call that uses the notes; notes dropped unused are charged to
+their owner as a call of their own.
+"""
+
+import os, time, asyncio, logging
+
+from openai import AsyncOpenAI
+
+from server.ledger import quota_ledger
+from server.metrics import Counter
+from server.quota import remaining
+from server.ratelimit import parse_limits, rate_limiter
+from server.summarize import (
+    SUMMARY_MAP_MAX_TOKENS, complete, chunk_prompt, count_tokens, normalize_text, reduce_notes,
+)
+from server.user_context import UserContext
+
+logger = logging.getLogger(__name__)
+
+# ── Settings ────────────────────────────────────────────────────────────────
+LIVE_NOTES_WINDOW_TOKENS = int(os.getenv("LIVE_NOTES_WINDOW_TOKENS", 1500))  # transcript per window
+LIVE_NOTES_TTL_S         = int(os.getenv("LIVE_NOTES_TTL_S", 4 * 3600))      # kept after last activity
+LIVE_NOTES_MAX_WINDOWS   = int(os.getenv("LIVE_NOTES_MAX_WINDOWS", 40))      # background windows per recording
+LIVE_NOTES_CONCURRENCY   = int(os.getenv("LIVE_NOTES_CONCURRENCY", 8))       # background calls in flight per process
+LIVE_NOTES_RATE_LIMIT    = os.getenv("LIVE_NOTES_RATE_LIMIT", "10/hour;30/day")  # recordings opted in per user
+
+TOKENS  = Counter("live_notes_tokens_total", "OpenAI tokens spent on live-notes windows.")
+REFUSED = Counter("live_notes_refused_total", "Live-notes opt-ins refused, by reason (quota/rate_limit).")
+
+_live_calls  = asyncio.Semaphore(max(1, LIVE_NOTES_CONCURRENCY))
+_rate_limits = parse_limits(LIVE_NOTES_RATE_LIMIT)
+
+
+class LiveNotesRefused(Exception):
+    """Live notes can't be turned on for this recording (the message says why)."""
+
+
+class LiveNotes:
+    """Partial notes of one recording, in window order."""
+
+    def __init__(self, client: AsyncOpenAI, user: UserContext, window_tokens: int = LIVE_NOTES_WINDOW_TOKENS):
+        self.client        = client
+        self.user          = user
+        self.owner         = user.username
+        self.window_tokens = window_tokens
+        self.touched       = time.monotonic()
+        self._parts: list[str] = []           # every final segment heard
+        self._window: list[str] = []          # segments not yet handed to a window
+        self._window_size = 0
+        self._chunks: list[str] = []
+        self._notes: list[str | None] = []    # summary per chunk, None until it's in
+        self._tasks: list[asyncio.Task] = []
+        self._unbilled = 0                    # tokens spent since the last condense()
+        self._lock     = asyncio.Lock()       # one condense() at a time: no window summarized twice
+        self._merged: tuple[tuple[int, str], str] | None = None  # (windows, instructions) → reduced notes
+
+    def add(self, text: str) -> None:
+        """`SttSession.on_final` hook: called on the event loop for every final segment."""
+        if not text:
+            return
+        self.touched = time.monotonic()
+        self._parts.append(text)
+        self._window.append(text)
+        self._window_size += count_tokens(text) + 1
+        if self._window_size >= self.window_tokens:
+            chunk = " ".join(self._window)
+            self._window, self._window_size = [], 0
+            self._chunks.append(chunk)
+            self._notes.append(None)
+            i = len(self._chunks) - 1
+            if len(self._tasks) < LIVE_NOTES_MAX_WINDOWS:  # beyond that: left to condense()
+                self._tasks.append(asyncio.create_task(self._background(i), name=f"live-notes-{i + 1}"))
+
+    async def _summarize(self, i: int, fanout: asyncio.Semaphore | None = None,
+                         calls: asyncio.Semaphore | None = None) -> None:
+        prompt = chunk_prompt(self._chunks[i], i + 1, None, "")
+        self._notes[i], tokens = await complete(self.client, prompt, SUMMARY_MAP_MAX_TOKENS, fanout, calls)
+        self._unbilled += tokens
+        TOKENS.inc(tokens)
+
+    async def _background(self, i: int) -> None:
+        try:
+            await self._summarize(i, calls=_live_calls)
+        except Exception as e:
+            logger.warning(f"Live notes window {i + 1} failed for {self.owner}: {e}")  # redone by condense()
+
+    def matches(self, transcript: str) -> bool:
+        return normalize_text(" ".join(self._parts)) == normalize_text(transcript)
+
+    async def condense(self, instructions: str, fanout: asyncio.Semaphore) -> tuple[str | None, int]:
+        """
+        Source for the final merge: partial notes plus the raw tail.  Returns
+        (None, tokens) when nothing was windowed yet – the transcript is then
+        short enough to summarize directly.
+        """
+        self.touched = time.monotonic()
+        async with self._lock:  # a concurrent call (double click, retry) waits and reuses this one's work
+            n = len(self._chunks)  # windows closed while we wait go into the raw tail
+            if not n:
+                return None, self._take_tokens()
+
+            key = (n, instructions)
+            if self._merged is None or self._merged[0] != key:
+                await asyncio.gather(*self._tasks[:n])
+                # windows whose background call failed (or was never made) are done now, on the request's time
+                await asyncio.gather(*(self._summarize(i, fanout) for i in range(n) if self._notes[i] is None))
+                merged, tokens = await reduce_notes(self.client, self._notes[:n], instructions, fanout)
+                self._unbilled += tokens
+                self._merged = (key, merged)
+
+            merged = self._merged[1]
+            if tail := self._chunks[n:] + self._window:
+                merged += "\n\nLatest part (raw transcript, not yet summarized):\n" + " ".join(tail)
+            return merged, self._take_tokens()
+
+    def _take_tokens(self) -> int:
+        tokens, self._unbilled = self._unbilled, 0
+        return tokens
+
+    def cancel(self) -> None:
+        """Drop the notes: tokens no /summarize call has billed yet are charged now."""
+        for task in self._tasks:
+            task.cancel()
+        if tokens := self._take_tokens():
+            reservation = quota_ledger.reserve(self.user, None)
+            reservation.charge(transcript_len=len(" ".join(self._parts)), tokens_used=tokens)
+            logger.info(f"Live notes of {self.owner} dropped unused: charged {tokens} tokens")
+
+
+class LiveNotesRegistry:
+    """Live notes by STT session id; dropped `ttl_s` after they were last used."""
+
+    def __init__(self, client: AsyncOpenAI, ttl_s: int = LIVE_NOTES_TTL_S):
+        self.client = client
+        self.ttl_s  = ttl_s
+        self._notes: dict[str, LiveNotes] = {}
+
+    def _purge(self) -> None:
+        cutoff = time.monotonic() - self.ttl_s
+        for notes_id, notes in list(self._notes.items()):
+            if notes.touched < cutoff:
+                notes.cancel()
+                del self._notes[notes_id]
+
+    async def start(self, notes_id: str, user: UserContext) -> LiveNotes:
+        """Raises `LiveNotesRefused` when the user has no quota left or opts in too often."""
+        if not user.is_admin and remaining(user) <= 0:
+            REFUSED.inc(reason="quota")
+            raise LiveNotesRefused("Quota exceeded: notes won't be drafted while recording.")
+        if await rate_limiter.hit("live_notes", str(user.id), _rate_limits) is not None:
+            REFUSED.inc(reason="rate_limit")
+            raise LiveNotesRefused("Too many recordings with live notes; try again later.")
+        self._purge()
+        if old := self._notes.get(notes_id):
+            old.cancel()
+        notes = self._notes[notes_id] = LiveNotes(self.client, user)
+        return notes
+
+    def get(self, notes_id: str, owner: str) -> LiveNotes | None:
+        self._purge()
+        notes = self._notes.get(notes_id)
+        return notes if notes and notes.owner == owner else None
+
+    def shutdown(self) -> None:
+        for notes in self._notes.values():
+            notes.cancel()
+        self._notes.clear()
@@ -1,14 +1,17 @@
 # mailer.py — Reusable async helpers for Lab12 e‑mail, now using SendGrid Web API
+#             (via the mail outbox: see server/outbox.py)
 
-import os
-import asyncio
-import traceback
+import os, logging
 from datetime import datetime, timedelta
 
 import bleach
 from dotenv import load_dotenv, find_dotenv
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from server import outbox
+
+logger = logging.getLogger(__name__)
 
 # ── env ────────────────────────────────────────────────────────────────────
 load_dotenv(find_dotenv(), override=True)
@@ -20,34 +23,17 @@ ADMIN_EMAIL      = os.getenv("ADMIN_EMAIL", EMAIL_SENDER)
 if not (SENDGRID_API_KEY and EMAIL_SENDER):
     raise RuntimeError("Add SENDGRID_API_KEY & EMAIL_SENDER to your .env")
 
-# ── internal send helper ────────────────────────────────────────────────────
-async def _send_via_sendgrid(to_email: str, subject: str, plain: str, html: str | None = None) -> None:
+# ── internal queue helper ───────────────────────────────────────────────────
+def _enqueue(db: AsyncSession, to_email: str, subject: str, plain: str, html: str | None = None) -> None:
     """
-    Fire off a SendGrid Mail object.  Uses asyncio to keep the API call non‑blocking.
+    Add the message to the outbox in `db`'s transaction; nothing is sent until
+    the caller commits, then the dispatcher delivers it through SendGrid.
     """
-    message = Mail(
-        from_email=EMAIL_SENDER,
-        to_emails=to_email,
-        subject=subject,
-        plain_text_content=plain,
-        html_content=html or plain,
-    )
-
-    loop = asyncio.get_running_loop()
-    def _blocking_send():
-        try:
-            sg = SendGridAPIClient(SENDGRID_API_KEY)
-            response = sg.send(message)
-            print(f"✅ [SendGrid] {to_email!r} → {subject!r}: {response.status_code}")
-        except Exception:
-            print(f"❌ [SendGrid] Failed to send to {to_email!r} / {subject!r}")
-            traceback.print_exc()
-            raise
-
-    await loop.run_in_executor(None, _blocking_send)
+    outbox.enqueue(db, to_email, subject, plain, html)
+    logger.info(f"Mail to {to_email!r} ({subject!r}) queued; sent once the transaction commits")
 
 # ── public API ─────────────────────────────────────────────────────────────
-async def send_verification_email(recipient: str, code: str, public_base_url: str) -> None:
+async def send_verification_email(db: AsyncSession, recipient: str, code: str, public_base_url: str) -> None:
     """
     Send a 6‑digit PIN with deep‑link verification button.
     """
@@ -80,7 +66,7 @@ async def send_verification_email(recipient: str, code: str, public_base_url: st
   </div>
 </body></html>"""
 
-    await _send_via_sendgrid(recipient, subject, plain, html)
+    _enqueue(db, recipient, subject, plain, html)
 
 """
     .btn {{
@@ -91,7 +77,7 @@ async def send_verification_email(recipient: str, code: str, public_base_url: st
  <a class="btn" href="{link}">Verify now</a>
 """
 
-async def send_feedback_alert(feedback: str, user_email: str) -> None:
+async def send_feedback_alert(db: AsyncSession, feedback: str, user_email: str) -> None:
     """
     Send moderators a copy of user feedback.
     """
@@ -104,10 +90,10 @@ async def send_feedback_alert(feedback: str, user_email: str) -> None:
         f"<p><strong>From:</strong> {clean_user}</p>"
         f"<pre style='white-space:pre-wrap'>{clean_fb}</pre>"
     )
-    await _send_via_sendgrid(ADMIN_EMAIL, subject, plain, html)
+    _enqueue(db, ADMIN_EMAIL, subject, plain, html)
 
 
-async def send_password_reset_email(recipient: str, code: str) -> None:
+async def send_password_reset_email(db: AsyncSession, recipient: str, code: str) -> None:
     """
     Send a 6‑digit password reset code.
     """
@@ -137,10 +123,11 @@ async def send_password_reset_email(recipient: str, code: str) -> None:
   </div>
 </body></html>"""
 
-    await _send_via_sendgrid(recipient, subject, plain, html)
+    _enqueue(db, recipient, subject, plain, html)
 
 
 async def send_user_verified_alert(
+    db: AsyncSession,
     user_email: str,
     full_name: str | None = None,
     total_verified: int = 0
@@ -168,4 +155,4 @@ async def send_user_verified_alert(
         f"  <li><strong>Total verified users:</strong> {total_verified}</li>"
         f"</ul>"
     )
-    await _send_via_sendgrid(ADMIN_EMAIL, subject, plain, html)
\ No newline at end of file
+    _enqueue(db, ADMIN_EMAIL, subject, plain, html)
\ No newline at end of file
@@ -6,35 +6,44 @@ FastAPI + WebSocket (Vosk) ➜ OpenAI summary ➜ Google Drive Save
 Audio: 16 kHz mono 16-bit PCM
 """
 
-import os, json, textwrap, datetime, re, logging # Import logging
+import os, json, textwrap, datetime, re, asyncio, logging # Import logging
 from dotenv import load_dotenv # Import dotenv
 from fastapi import FastAPI, WebSocket, WebSocketException, HTTPException, Depends, status, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.responses import FileResponse, JSONResponse, HTMLResponse
-from fastapi import Cookie, Form
-import markdown
+from fastapi.responses import FileResponse, JSONResponse, HTMLResponse, PlainTextResponse, StreamingResponse
+from fastapi import Cookie, Form, File, UploadFile
+from starlette.background import BackgroundTask
 from pathlib import Path
 from pydantic import BaseModel, Field
 from typing import Optional, Annotated
-from vosk import Model, KaldiRecognizer
+from vosk import Model
 from openai import AsyncOpenAI
 import bleach
-from io import BytesIO
 from jose import JWTError, jwt
 from datetime import timedelta
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_ipaddr
-from slowapi.errors import RateLimitExceeded
-from slowapi.middleware import SlowAPIMiddleware
 # Db imports
 from contextlib import asynccontextmanager
-from server.db import engine, get_db
+from server.db import AsyncSessionLocal, engine, get_db
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import delete, select, func
 from server import crud, mailer
+from server.stt import SttEngine
+from server.transcribe import TooManyJobs, Transcriber, UploadTooLarge
+from server.audio import check_rate
+from server.summarize import NotesStream, load_encoding, restamp, summarize_transcript
+from server.summary_cache import SummaryCache, summary_key
+from server.quota import current_user_context, plan_for, remaining
+from server.ledger import Reservation, quota_ledger
+from server.ratelimit import rate_limit, rate_limiter
+from server.tokens import verified_tokens
+from server.pages import PageCache
+from server.assets import ASSET_BUILD_DIR, ASSET_URL, AssetPipeline, PrecompressedFiles
+from server.user_context import InvalidationListener, UserContext, load_user_context
+from server.live_notes import LiveNotesRefused, LiveNotesRegistry
+from server import drive, metrics, outbox, passwords
 from server.crud import (
     DEFAULT_PLANS,   
     get_user_by_username,
@@ -47,9 +56,6 @@ from sqlalchemy import insert
 from server.models import Role, User, UserToken, EmailVerification, UserSubscriptionHistory, user_roles
 # Google API Imports
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaIoBaseUpload
 # PDF Generation (Using FPDF2 for macOS compatibility)
 # from fpdf import FPDF, HTMLMixin
 
@@ -96,7 +102,28 @@ RATE_LIMIT_SUMMARIZE_DAY = os.getenv("RATE_LIMIT_SUMMARIZE_DAY", "100/day")
 async def lifespan(app: FastAPI):
     # async with engine.begin() as conn:
     #     await conn.run_sync(models.Base.metadata.create_all)
+    # tiktoken may fetch its BPE file on first use: not on the event loop
+    await asyncio.get_running_loop().run_in_executor(None, load_encoding)
+    user_context_listener = InvalidationListener(engine)
+    user_context_listener.start()
+    await quota_ledger.start()  # replays journals a crashed worker left behind
+    drive_exporter.start()
+    mail_dispatcher.start()
+    asset_pipeline.build()      # before the pages, which link the fingerprinted names
+    page_cache.warm()
     yield
+    live_notes.shutdown()       # charges unused live notes: before the ledger's last flush
+    await quota_ledger.stop()   # flushes what's still pending
+    await user_context_listener.stop()
+    if stt_engine:
+        stt_engine.shutdown()
+    if transcriber:
+        transcriber.shutdown()
+    passwords.shutdown()
+    await drive_exporter.stop()
+    await mail_dispatcher.stop()  # unsent mail stays in the outbox
+    await rate_limiter.close()
+    drive.shutdown()
 
 # ── Create FastAPI with lifespan ─────────────────────────────────────────
 app = FastAPI(lifespan=lifespan)
@@ -113,7 +140,7 @@ async def add_csp_header(request: Request, call_next):
         "style-src 'self' 'unsafe-inline'; "
 
         # active content
-        "script-src 'self' 'unsafe-inline' blob: "
+        "script-src 'self' blob: "
             "https://cdnjs.cloudflare.com "
             "https://cdn.jsdelivr.net "
             "https://accounts.google.com "
@@ -142,18 +169,28 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
     return encoded_jwt
 
-def verify_token(token: str, credentials_exception):
-    try:
-        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+def verify_token(token: str, credentials_exception, state=None):
+    """Username (subject) of a valid token.  Pass `request.state` to reuse the result within a request."""
+    cached = getattr(state, "verified_token", None)
+    if cached and cached[0] == token:
+        return cached[1]
+    # signature already checked by an earlier request (server/tokens.py)?
+    payload = verified_tokens.get(token)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+        except JWTError as e:
+            logger.warning(f"JWT Error during token verification: {e}")
+            raise credentials_exception
+        if payload.get("sub") is None:
             logger.warning("JWT token missing 'sub' field.")
             raise credentials_exception
-        # Return the username (subject) from the token
-        return username
-    except JWTError as e:
-        logger.warning(f"JWT Error during token verification: {e}")
-        raise credentials_exception
+        verified_tokens.put(token, payload)
+    # Return the username (subject) from the token
+    username: str = payload["sub"]
+    if state is not None:
+        state.verified_token = (token, username)
+    return username
 
 async def get_token_for_websocket(token: Annotated[str | None, Query()] = None):
     if token is None:
@@ -163,34 +200,26 @@ async def get_token_for_websocket(token: Annotated[str | None, Query()] = None):
     username = verify_token(token, credentials_exception)
     return username
 
-# ── Rate Limiter Setup ──────────────────────────────────────────────────────
-def get_limiter_key(request: Request) -> str:
-    # 1) try the session cookie
-    cookie_token = request.cookies.get("access_token")
-    if cookie_token:
-        try:
-            username = verify_token(cookie_token, JWTError("bad"))  # <- returns the sub
-            return username
-        except JWTError:
-            pass           # fall through to IP on bad cookie
-
-    # 2) fallback = client IP (same as before)
-    return get_ipaddr(request)
-
-limiter = Limiter(key_func=get_limiter_key)
-
 # ── OpenAI client ───────────────────────────────────────────────────────────
 client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+summary_cache = SummaryCache()
+live_notes = LiveNotesRegistry(client)
+drive_exporter = drive.DriveExporter()
+mail_dispatcher = outbox.MailDispatcher(mailer.SENDGRID_API_KEY, mailer.EMAIL_SENDER)
 
 # ── Constants ───────────────────────────────────────────────────────────────
 MODEL_PATH  = "models/vosk-model-en-us-0.22"
-SAMPLE_RATE = 48_000  # Hz
+SAMPLE_RATE = 48_000  # Hz – what the browser worklet sends; resampled for the model
 MAX_CUSTOM_INSTRUCTION_LENGTH = 500 # Max characters for simple custom instructions
 
-# Add Rate Limiter Middleware
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-app.add_middleware(SlowAPIMiddleware)
+# Too many logins / sign-ups hashing passwords at once (see server/passwords.py)
+async def _hasher_busy_handler(request: Request, exc: passwords.HasherBusy):
+    return JSONResponse(
+        {"detail": "Server busy, please try again in a moment."},
+        status_code=503,
+        headers={"Retry-After": "1"},
+    )
+app.add_exception_handler(passwords.HasherBusy, _hasher_busy_handler)
 
 # Add CORS Middleware (ensure it's added correctly relative to other middleware if needed)
 # app.add_middleware(
@@ -205,11 +234,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-
-@app.on_event("startup")
-async def startup():
-    limiter.storage = None
-
 # ── Load Vosk model once ────────────────────────────────────────────────────
 if not os.path.exists(MODEL_PATH):
     logger.error(f"Vosk model not found at {MODEL_PATH}. Please download and place it correctly.")
@@ -219,6 +243,10 @@ else:
     model = Model(MODEL_PATH)
     logger.info("Vosk model loaded successfully.")
 
+# decoding runs on worker threads so the event loop stays free for HTTP
+stt_engine = SttEngine(model) if model else None
+transcriber = Transcriber(model) if model else None
+
 # ── Token Endpoint ──────────────────────────────────────────────────────────
 class Token(BaseModel):
     access_token: str
@@ -238,15 +266,18 @@ async def register(                                             # ← rewritten
         raise HTTPException(status_code=400, detail="This email is already in use.")
 
     # 2) create the user (unverified)
-    user = await crud.create_user(db, username, password, full_name)
+    user = await crud.create_user(db, username, password, full_name, commit=False)
 
-    # 3) generate & send verification code
-    code = await crud.create_verification_code(db, user.username, user.id)
+    # 3) generate & send verification code – user, code and mail commit together
+    code = await crud.create_verification_code(db, user.username, user.id, commit=False)
     await mailer.send_verification_email(
+        db,
         recipient=user.username,
         code=code,
         public_base_url=PUBLIC_BASE_URL
     )
+    await db.commit()
+    await db.refresh(user)
     logger.info(f"Sent verification PIN to {user.username}: {code}")
 
     # 4) return the new user (frontend knows to show the “enter PIN” form)
@@ -291,6 +322,7 @@ def logout():
     return resp
 
 async def get_current_user_from_cookie(
+    request: Request,
     access_token: str | None = Cookie(None),
 ):
     if not access_token:
@@ -304,46 +336,26 @@ async def get_current_user_from_cookie(
         headers={"WWW-Authenticate": "Bearer"},
     )
     # reuse your existing verify_token()
-    return verify_token(access_token, credentials_exception)
+    return verify_token(access_token, credentials_exception, request.state)
 
 class MeOut(BaseModel):
     username: str
     full_name: str | None
 
 @app.get("/me")
-async def get_current_user_route(current_username: str = Depends(get_current_user_from_cookie),
-    db: AsyncSession = Depends(get_db),):
-    user = await crud.get_user_by_username(db, current_username)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+async def get_current_user_route(user: Annotated[UserContext, Depends(current_user_context)]):
     return MeOut(username=user.username, full_name=user.full_name)
 
-PLAN_MAP: dict[str, dict] = {p["name"]: p for p in DEFAULT_PLANS}
-FREE_PLAN = PLAN_MAP["free"]
-
 @app.get("/me/quota")
-async def quota_api(
-    current_user: str = Depends(get_current_user_from_cookie),
-    db: AsyncSession  = Depends(get_db)
-):
-    u = await crud.get_user_by_username(db, current_user)
-    if not u:
-        raise HTTPException(404, "User not found")
-
+async def quota_api(u: Annotated[UserContext, Depends(current_user_context)]):
     # did they have an admin row?
-    admin_q = (
-      select(func.count())
-      .select_from(user_roles.join(Role))
-      .where(user_roles.c.user_id == u.id, Role.name == "admin")
-    )
-    admin_count = (await db.execute(admin_q)).scalar_one()
-    if admin_count:
+    if u.is_admin:
         return { "remaining": "∞",
             "plan": {"name": "admin", "quota": "∞"}}
 
-    plan = PLAN_MAP.get(u.subscription_plan, FREE_PLAN)
+    plan = plan_for(u)
     return {
-      "remaining": plan["quota"] - u.summarize_call_count,
+      "remaining": remaining(u),
       "plan": plan
     }
 
@@ -369,12 +381,13 @@ async def websocket_stt(ws: WebSocket):
         await ws.close(code=status.WS_1011_INTERNAL_ERROR, reason="Vosk model unavailable")
         return
 
-    rec = KaldiRecognizer(model, SAMPLE_RATE)
-    rec.SetWords(True)
+    session = None
+    resumable = False  # park the session instead of closing it when the socket drops
     try:
         while True:
             msg = await ws.receive()
             if msg["type"] == "websocket.disconnect":
+                resumable = msg.get("code") not in (1000, 1005)
                 break
 
             if "text" in msg:
@@ -382,20 +395,35 @@ async def websocket_stt(ws: WebSocket):
                 if data.get("type") == "ping":
                     await ws.send_json({"type": "pong"})
                     continue
-                # (you could negotiate control commands here)
+                if data.get("type") == "config":
+                    if session is None:
+                        if data.get("resume"):
+                            session = await stt_engine.resume(data["resume"], username, ws.send_json)
+                        if session is None:
+                            session = await stt_engine.open_session(SAMPLE_RATE, ws.send_json, owner=username)
+                        # the client re-sends whatever it sent after frame `seq`
+                        await ws.send_json({"type": "session", "id": session.token, "seq": session.seq})
+                    # opt-in: draft notes while recording (signed-in users only; resumed sessions keep theirs)
+                    if data.get("notes") and username and session.on_final is None:
+                        try:
+                            async with AsyncSessionLocal() as db:
+                                user = await load_user_context(db, username)
+                            if user is None:
+                                raise LiveNotesRefused("User not found.")
+                            session.on_final = (await live_notes.start(session.token, user)).add
+                        except LiveNotesRefused as e:
+                            await ws.send_json({"type": "notes", "enabled": False, "detail": str(e)})
+                    ack = await session.configure(data)
+                    if ack:
+                        await ws.send_json(ack)
                 continue
 
             chunk = msg["bytes"]
             logger.debug(f"🔊 got {len(chunk)}-byte chunk from client")
-            if rec.AcceptWaveform(chunk):
-              res = json.loads(rec.Result())
-              logger.debug(f"final: {res['text'][:50]}")
-              # send exactly what the client expects:
-              await ws.send_json({ "text": res["text"] })
-            else:
-              pr = json.loads(rec.PartialResult())
-              logger.debug(f"partial: {pr['partial'][:50]}")
-              await ws.send_json({ "partial": pr["partial"] })
+            if session is None:  # client skipped the config message
+                session = await stt_engine.open_session(SAMPLE_RATE, ws.send_json, owner=username)
+            # blocks while this session's decode queue is full → socket backpressure
+            await session.feed(chunk)
     except WebSocketException:
         logger.info(f"Client disconnected cleanly (user={username})")
     except Exception as e:
@@ -403,37 +431,109 @@ async def websocket_stt(ws: WebSocket):
         await ws.close(code=status.WS_1011_INTERNAL_ERROR, reason="Internal server error")
     finally:
         logger.info(f"Cleaning up resources for user {username}")
+        if session and resumable:
+            stt_engine.park(session)
+        elif session:
+            await session.close()
         try:
             await ws.close(code=status.WS_1000_NORMAL_CLOSURE)
         except RuntimeError:
             # already closed, ignore
             pass
 
+# ── /transcribe (Protected): offline jobs for uploaded recordings ──────────
+UPLOAD_CHUNK = 1024 * 1024
+
+def _require_transcriber() -> Transcriber:
+    if not transcriber:
+        raise HTTPException(status_code=503, detail="Vosk model not loaded on server.")
+    return transcriber
+
+def _new_transcribe_job(svc: Transcriber, current_user: str, sample_rate: int | None):
+    if sample_rate is not None:
+        try:
+            check_rate(sample_rate)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    try:
+        return svc.new_job(current_user)
+    except TooManyJobs as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+@app.post("/transcribe", status_code=202)
+async def transcribe_upload(
+    current_user: Annotated[str, Depends(get_current_user_from_cookie)],
+    file: UploadFile = File(...),
+    sample_rate: int | None = Form(None),   # only needed for raw PCM uploads
+):
+    """Upload a 16-bit WAV (or raw mono PCM + sample_rate) and get a job id back."""
+    svc = _require_transcriber()
+    job = _new_transcribe_job(svc, current_user, sample_rate)
+    try:
+        while data := await file.read(UPLOAD_CHUNK):
+            await svc.append(job, data)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception:
+        svc.discard(job)   # client went away mid-upload
+        raise
+    svc.submit(job, sample_rate)
+    logger.info(f"Transcription job {job.id} queued for {current_user} ({job.received} bytes)")
+    return job.public()
+
+@app.post("/transcribe/stream", status_code=202)
+async def transcribe_stream(
+    request: Request,
+    current_user: Annotated[str, Depends(get_current_user_from_cookie)],
+    sample_rate: int | None = Query(None),
+):
+    """Same as /transcribe, but the request body *is* the audio (chunked uploads welcome)."""
+    svc = _require_transcriber()
+    job = _new_transcribe_job(svc, current_user, sample_rate)
+    try:
+        async for data in request.stream():
+            if data:
+                await svc.append(job, data)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception:
+        svc.discard(job)   # client went away mid-upload
+        raise
+    svc.submit(job, sample_rate)
+    logger.info(f"Transcription job {job.id} queued for {current_user} ({job.received} bytes)")
+    return job.public()
+
+@app.get("/transcribe/{job_id}")
+async def transcribe_status(
+    job_id: str,
+    current_user: Annotated[str, Depends(get_current_user_from_cookie)],
+):
+    job = _require_transcriber().get(job_id, current_user)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.public()
+
 # ── /summarize (Protected & Rate Limited) ───────────────────────────────────
 from server.quota import enforce_quota
 
+# per user, checked before the quota is touched (see server/ratelimit.py)
+summarize_rate_limit = rate_limit(
+    "summarize",
+    f"{RATE_LIMIT_SUMMARIZE_MINUTE};{RATE_LIMIT_SUMMARIZE_DAY}",
+    "Rate limit exceeded: max 5 notes/minute, 100 notes/day.",
+)
+
 class SumReq(BaseModel):
     transcript: str
     custom_instructions: str | None = None
+    notes_session: str | None = None  # /ws/stt session id whose live notes can be merged
 
     model_config = {"populate_by_name": True}
 
 class SumResp(BaseModel):
     outline: str
 
-@app.post("/summarize", response_model=SumResp)
-@limiter.limit(f"{RATE_LIMIT_SUMMARIZE_MINUTE};{RATE_LIMIT_SUMMARIZE_DAY}", error_message="Rate limit exceeded: max 5 notes/minute, 100 notes/day.")
-async def summarize(
-    request: Request,
-    r: SumReq,
-    user: Annotated[User, Depends(enforce_quota)],
-    db: AsyncSession = Depends(get_db),
-):
-    current_user = user.username
-    logger.info(f"Summarize request received for user: {current_user}")
-    now = datetime.datetime.now().strftime("%B %d, %Y at %I:%M %p")
-
-    text = r.transcript
+def _custom_instructions(r: SumReq, current_user: str) -> str:
     instructions = r.custom_instructions or ""
     if instructions and len(instructions) > MAX_CUSTOM_INSTRUCTION_LENGTH:
         logger.warning(f"User {current_user} provided custom instructions exceeding length limit.")
@@ -441,62 +541,93 @@ async def summarize(
             status_code=400,
             detail=f"Custom instructions exceed maximum length of {MAX_CUSTOM_INSTRUCTION_LENGTH} characters."
         )
+    return instructions
 
-    final_prompt = textwrap.dedent(f"""
-        You are an expert lecture note-taker.
-        The raw transcript below may contain speech-to-text errors;
-        correct obvious spelling/grammar mistakes while keeping meaning.
-        Produce **Markdown** with:
-
-        # A top-level title you infer from context (or "Untitled Lecture" if unclear)
+def _live_notes_for(r: SumReq, current_user: str):
+    """The recording's live notes, if they were drafted from exactly this transcript."""
+    live = live_notes.get(r.notes_session, current_user) if r.notes_session else None
+    return live if live and live.matches(r.transcript) else None
 
-        **Date & Time:** {now}
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-        • A bulleted outline (topic → sub-points)
-        • "Key Terms" and "Action Items" sections
-        • Preserve equations in LaTeX.
+@app.post("/summarize", response_model=SumResp)
+async def summarize(
+    r: SumReq,
+    _: Annotated[None, Depends(summarize_rate_limit)],
+    quota: Annotated[Reservation, Depends(enforce_quota)],
+):
+    current_user = quota.user.username
+    logger.info(f"Summarize request received for user: {current_user}")
+    now = datetime.datetime.now().strftime("%B %d, %Y at %I:%M %p")
 
-        {f"Additionally, follow these specific instructions: {instructions}" if instructions else ""}
+    text = r.transcript
+    instructions = _custom_instructions(r, current_user)
 
-        Transcript:
-        \"\"\"{text}\"\"\"
-    """)
+    # the reservation is released by enforce_quota unless charged below
+    # identical retries are served from the cache: no OpenAI call, no quota spent
+    cache_key = summary_key(text, instructions)
+    if cached := await summary_cache.get(cache_key):
+        return SumResp(outline=restamp(cached, now))
 
     try:
-        chat = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": final_prompt}],
-            temperature=0.3,
-            max_tokens=700,
+        # long transcripts are summarized chunk-wise (in parallel, or live while recording), then merged
+        md, tokens_used = await summarize_transcript(
+            client, text, instructions, now, live=_live_notes_for(r, current_user)
         )
-        md = chat.choices[0].message.content.strip()
-
-        # bump counters & log call
-        async with AsyncSession(engine) as db:
-            user = await crud.get_user_by_username(db, current_user)
-            await crud.bump_usage(
-                db,
-                user_id=user.id,
-                transcript_len=len(r.transcript),
-                tokens_used=chat.usage.total_tokens if chat.usage else 0
-            )
 
-        def fix_flat_lists(md: str) -> str:
-            """Turn ‘Key Terms – a – b – c’ into proper bullets."""
-            def _repl(m):
-                title, body = m.group(1), m.group(2)
-                items = [f"- {s.strip()}"    # split on “ - ”
-                    for s in re.split(r"\s*-\s+(?!-)", body) if s.strip()]
-                return f"**{title}:**\n" + "\n".join(items) + "\n"
-            
-            return re.sub(r"\*\*(Key Terms|Action Items)\*:?\s*(.+)", _repl, md)
-        
-        md = fix_flat_lists(md)
+        # count the call & log it (written to the DB behind our back)
+        quota.charge(transcript_len=len(r.transcript), tokens_used=tokens_used)
+        await summary_cache.put(cache_key, md)
 
         return SumResp(outline=md)
     except Exception as e:
         logger.error(f"Error calling OpenAI API for user {current_user}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error calling OpenAI API: {e}")
+
+@app.post("/summarize/stream")
+async def summarize_stream(
+    r: SumReq,
+    _: Annotated[None, Depends(summarize_rate_limit)],
+    quota: Annotated[Reservation, Depends(enforce_quota)],
+):
+    """Same notes as /summarize, sent as server-sent events: `delta`* then `done` (or `error`)."""
+    current_user = quota.user.username
+    logger.info(f"Streaming summarize request received for user: {current_user}")
+    now = datetime.datetime.now().strftime("%B %d, %Y at %I:%M %p")
+    instructions = _custom_instructions(r, current_user)
+    cache_key = summary_key(r.transcript, instructions)
+    notes = NotesStream(client, r.transcript, instructions, now, live=_live_notes_for(r, current_user))
+
+    async def events():
+        # the reservation is released if the stream fails or the client goes away
+        async with quota:
+            if cached := await summary_cache.get(cache_key):
+                cached = restamp(cached, now)
+                yield _sse("delta", {"text": cached})
+                yield _sse("done", {"outline": cached})
+                return
+            try:
+                async for delta in notes:
+                    yield _sse("delta", {"text": delta})
+
+                # count the call & log it once the whole completion is in
+                quota.charge(transcript_len=len(r.transcript), tokens_used=notes.tokens)
+                await summary_cache.put(cache_key, notes.markdown)
+                yield _sse("done", {"outline": notes.markdown})
+            except Exception as e:
+                logger.error(f"Error streaming OpenAI API response for user {current_user}: {e}", exc_info=True)
+                yield _sse("error", {"detail": f"Error calling OpenAI API: {e}"})
+
+    # from here on the stream owns the reservation; the background task releases
+    # it should the stream never start (client gone before the first byte)
+    quota.keep()
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},  # no proxy buffering
+        background=BackgroundTask(quota.release),
+    )
     
 
 # ── /save-to-drive (Protected) ──────────────────────────────────────────────
@@ -506,13 +637,13 @@ class DriveSaveReq(BaseModel):
     folder_id: str
     google_access_token: str
 
-class DriveSaveResp(BaseModel):
-    file_id: str
-    file_name: str
-    folder_id: str
-
-@app.post("/save-to-drive", response_model=DriveSaveResp)
-async def save_to_drive(r: DriveSaveReq, current_user: Annotated[str, Depends(get_current_user_from_cookie)]): # Use your cookie dependency
+@app.post("/save-to-drive", status_code=202)
+async def save_to_drive(
+    r: DriveSaveReq,
+    current_user: Annotated[str, Depends(get_current_user_from_cookie)], # Use your cookie dependency
+    db: AsyncSession = Depends(get_db),
+):
+    """Queue the notes for upload and return the export job; poll GET /save-to-drive/{job_id}."""
     logger.info(f"Save to Google Drive request received for user: {current_user}, folder: {r.folder_id}")
 
     try:
@@ -520,29 +651,21 @@ async def save_to_drive(r: DriveSaveReq, current_user: Annotated[str, Depends(ge
         creds = Credentials(token=r.google_access_token)
         # ------- persist refresh‑token if present ------------------
         if creds.refresh_token:
-            async with AsyncSession(engine) as db:
-                user_row = await crud.get_user_by_username(db, current_user)
-                await db.execute(
-                    insert(UserToken).values(
-                        user_id       = user_row.id,
-                        provider      = "google",
-                        refresh_token = creds.refresh_token,
-                        expires_at    = datetime.datetime.now(datetime.timezone.utc)
-                                        + datetime.timedelta(days=90)
-                    ).on_conflict_do_nothing(
-                        index_elements=["user_id", "provider"]
-                    )
+            user_row = await crud.get_user_by_username(db, current_user)
+            await db.execute(
+                insert(UserToken).values(
+                    user_id       = user_row.id,
+                    provider      = "google",
+                    refresh_token = creds.refresh_token,
+                    expires_at    = datetime.datetime.now(datetime.timezone.utc)
+                                    + datetime.timedelta(days=90)
+                ).on_conflict_do_nothing(
+                    index_elements=["user_id", "provider"]
                 )
-                await db.commit()
+            )
+            await db.commit()
         # -------------------------
 
-        # Configure http_client with timeout if needed
-        # http_client = httplib2.Http(timeout=300)
-        # service = build('drive', 'v3', credentials=creds, http=http_client)
-        # OR use default timeout:
-        service = build('drive', 'v3', credentials=creds)
-
-
         # *** CHANGE: Use received HTML, skip markdown conversion ***
         # html_body = STYLE_BLOCK + md_to_html(r.notes_content) # Old way
         html_body = STYLE_BLOCK + r.notes_html # New way - Prepend style
@@ -555,44 +678,36 @@ async def save_to_drive(r: DriveSaveReq, current_user: Annotated[str, Depends(ge
         logger.info(f"Size of HTML body being uploaded: {len(clean_html.encode('utf-8'))} bytes")
 
 
-        # 2) Drive metadata – tell Drive we want a Google Doc
-        file_metadata = {
-          "name": r.filename.rsplit(".",1)[0],                 # drop .md
-          "mimeType": "application/vnd.google-apps.document",  # <-- key!
-          "parents": [r.folder_id]
-        }
-
-        # 3) media upload – send the cleaned html blob
-        media = MediaIoBaseUpload(
-          BytesIO(clean_html.encode("utf-8")),
-          mimetype="text/html",          # importable format
-          resumable=True
+        # 2) queue the upload – Drive imports the html as a Google Doc, retried on 429/5xx
+        job = await drive_exporter.submit(
+          current_user,
+          r.google_access_token,
+          clean_html,
+          r.filename.rsplit(".",1)[0],                         # drop .md
+          r.folder_id,
         )
+        logger.info(f"Drive export {job.id} queued for user {current_user}.")
+        return job.public()
 
-        file = service.files().create(
-          body=file_metadata,
-          media_body=media,
-          fields="id,name" # Request name as well
-        ).execute()
-
-        logger.info(f"File '{file.get('name')}' (ID: {file.get('id')}) created successfully in Drive for user {current_user}.")
-        return DriveSaveResp(file_id=file.get("id"), file_name=file.get("name"), folder_id=r.folder_id)
-
-    except HttpError as error:
-        logger.error(f"An Google Drive API error occurred for user {current_user}: {error}")
-         # Try to parse Google's error message if possible
-        detail = f"Google Drive API error: {error.resp.status} {error.reason}"
-        try:
-            error_content = json.loads(error.content.decode('utf-8'))
-            if 'error' in error_content and 'message' in error_content['error']:
-                detail = f"Google Drive Error: {error_content['error']['message']}"
-        except Exception:
-            pass # Ignore parsing errors, use generic message
-        raise HTTPException(status_code=error.resp.status if error.resp else 500, detail=detail)
+    except drive.ExportQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
 
     except Exception as e:
         logger.error(f"Unexpected error saving to Google Drive for user {current_user}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Unexpected error saving to Drive: {e}")
+
+@app.get("/save-to-drive/{job_id}")
+async def save_to_drive_status(
+    job_id: str,
+    current_user: Annotated[str, Depends(get_current_user_from_cookie)],
+):
+    try:
+        job = await drive_exporter.get(job_id, current_user)
+    except drive.ExportStatusUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.public()
     
 
 # ── /feedback (Protected) ─────────────────────────────────────────────────── ADDED
@@ -607,7 +722,8 @@ async def submit_feedback(
 ):
     await crud.store_feedback(db, (await crud.get_user_by_username(db, current_user)).id, {"text": r.feedback_text})
     try:
-        await mailer.send_feedback_alert(r.feedback_text, current_user)
+        await mailer.send_feedback_alert(db, r.feedback_text, current_user)
+        await db.commit()
     except Exception as e:
         logger.error("feedback alert mail failed", exc_info=True)
     return {"message": "Thanks for your feedback!"}
@@ -629,8 +745,9 @@ async def resend_code(
     if user.email_verified:
         return {"detail": "Already verified"}
 
-    code = await crud.create_verification_code(db, r.email, user.id)
-    await mailer.send_verification_email(r.email, code, PUBLIC_BASE_URL)
+    code = await crud.create_verification_code(db, r.email, user.id, commit=False)
+    await mailer.send_verification_email(db, r.email, code, PUBLIC_BASE_URL)
+    await db.commit()
     return {"detail": "Verification code resent"}
 
 
@@ -680,7 +797,8 @@ async def verify_via_link(email: str, pin: str, db: AsyncSession = Depends(get_d
         try:
             user = await crud.get_user_by_username(db, email)
             total = await crud.count_verified_users(db)
-            await mailer.send_user_verified_alert(email, user.full_name, total)
+            await mailer.send_user_verified_alert(db, email, user.full_name, total)
+            await db.commit()
         except Exception:
             logger.exception("Failed to send admin alert for email‑link verification")
         return VERIFY_OK
@@ -695,7 +813,8 @@ async def check_pin(r: PinReq, db=Depends(get_db)):
     try:
         user = await crud.get_user_by_username(db, r.email)
         total = await crud.count_verified_users(db)
-        await mailer.send_user_verified_alert(r.email, user.full_name, total)
+        await mailer.send_user_verified_alert(db, r.email, user.full_name, total)
+        await db.commit()
     except Exception:
         logger.exception("Failed to send admin alert for PIN verification")
 
@@ -710,8 +829,9 @@ class ResetConfirmReq(BaseModel):
 async def password_reset_request(r: EmailReq, db: AsyncSession = Depends(get_db)):
     user = await get_user_by_username(db, r.email)
     if user:
-        code = await create_password_reset_code(db, r.email, user.id)
-        await mailer.send_password_reset_email(r.email, code)
+        code = await create_password_reset_code(db, r.email, user.id, commit=False)
+        await mailer.send_password_reset_email(db, r.email, code)
+        await db.commit()
 
     # always succeed
     return {"detail":"If that email exists, a code has been sent."}
@@ -727,53 +847,57 @@ async def password_reset_verify(r: ResetConfirmReq, db: AsyncSession = Depends(g
 # Front end:
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
+# same files, fingerprinted + precompressed, cached for good (see server/assets.py)
+asset_pipeline = AssetPipeline()
+app.mount(ASSET_URL, PrecompressedFiles(directory=ASSET_BUILD_DIR, check_dir=False), name="assets")
 # 2) tell FastAPI where your templates live
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["asset_url"] = asset_pipeline.url
 
 BASE_DIR = Path(__file__).parent.parent   # one level up from server/
 DOCS_DIR = BASE_DIR / "docs"
 
-def render_markdown(path: str) -> str:
-    with open(path, "r", encoding="utf-8") as f:
-        text = f.read()
-    # you can also use `marked.js` on the client, but here we do it server‑side
-    return markdown.markdown(text, extensions=["fenced_code", "tables"])
+# 3) the pages don't depend on the request: rendered once, served from memory
+#    with an ETag (see server/pages.py)
+page_cache = PageCache(templates.env, Path("templates"))
+page_cache.add("index", "index.html")
+page_cache.add("docs", "docs.html")
+page_cache.add("privacy", "docs.html", markdown=DOCS_DIR / "PRIVACY.md", page_title="Privacy Policy")
+page_cache.add("terms", "docs.html", markdown=DOCS_DIR / "TERMS.md", page_title="Terms of Service")
 
 # ender index.html through Jinja so your partials can be included
 @app.get("/", response_class=HTMLResponse)
 async def get_index(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    return page_cache.respond(request, "index")
 
 # same for docs
 @app.get("/docs-page", response_class=HTMLResponse)
 async def get_docs(request: Request):
-    return templates.TemplateResponse("docs.html", {"request": request})
+    return page_cache.respond(request, "docs")
 
 @app.get("/privacy", response_class=HTMLResponse)
 async def privacy(request: Request):
-    md_path = DOCS_DIR / "PRIVACY.md"
     try:
-        html = render_markdown(md_path)
+        return page_cache.respond(request, "privacy")
     except FileNotFoundError:
         raise HTTPException(404, "Privacy Policy not found")
-    return templates.TemplateResponse("docs.html", {
-        "request": request,
-        "markdown_content": html,
-        "page_title": "Privacy Policy"
-    })
 
 @app.get("/terms", response_class=HTMLResponse)
 async def terms(request: Request):
-    md_path = DOCS_DIR / "TERMS.md"
     try:
-        html = render_markdown(md_path)
+        return page_cache.respond(request, "terms")
     except FileNotFoundError:
         raise HTTPException(404, "Terms of Service not found")
-    return templates.TemplateResponse("docs.html", {
-        "request": request,
-        "markdown_content": html,
-        "page_title": "Terms of Service"
-    })
+
+# ── /metrics (ops; bearer METRICS_TOKEN) ────────────────────────────────────
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics_endpoint(request: Request):
+    # disabled unless a token is configured; scrapers send it as a bearer token
+    if not METRICS_TOKEN or request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=404, detail="Not Found")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 # ── Main entry point (for direct execution) ─────────────────────────────────
 if __name__ == "__main__":
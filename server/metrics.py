@@ -0,0 +1,64 @@
+"""
+server/metrics.py
+Minimal in-process metrics, rendered in the Prometheus text format at /metrics.
+"""
+
+import threading
+from typing import Callable
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()  # bumped from worker threads too
+        REGISTRY.append(self)
+
+    def samples(self):
+        with self._lock:
+            return list(self._values.items())
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0.0)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float] | None = None):
+        super().__init__(name, help)
+        self._fn = fn  # sampled at render time when given
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+    def samples(self):
+        if self._fn:
+            return [((), self._fn())]
+        return super().samples()
+
+
+REGISTRY: list[_Metric] = []
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines += [f"# HELP {metric.name} {metric.help}", f"# TYPE {metric.name} {metric.kind}"]
+        for labels, value in metric.samples():
+            tags = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"{metric.name}{{{tags}}} {value:g}" if tags else f"{metric.name} {value:g}")
+    return "\n".join(lines) + "\n"
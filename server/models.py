@@ -1,6 +1,6 @@
 from datetime import datetime, timezone
 from sqlalchemy import (
-    Column, Index, Integer, String, DateTime, Boolean,
+    Column, Index, Integer, String, Text, DateTime, Boolean,
     JSON, ForeignKey, Numeric, Table, text, func
 )
 from sqlalchemy.orm import declarative_base, relationship
@@ -100,6 +100,7 @@ class SummarizeCall(Base):
     called_at        = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     transcript_length = Column(Integer, nullable=False)
     tokens_used      = Column(Integer, nullable=False)
+    call_id          = Column(String(32), unique=True, index=True)  # quota ledger idempotency key
     user             = relationship("User", back_populates="summarize_calls")
 
 class UserToken(Base):
@@ -163,4 +164,48 @@ Index(
 )
 
 
-
+class SummaryCacheEntry(Base):
+    """Generated notes keyed by a hash of transcript, instructions, model and prompt version."""
+    __tablename__ = "summary_cache"
+
+    key        = Column(String(64), primary_key=True)
+    outline    = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class MailOutbox(Base):
+    """Transactional mail waiting for the dispatcher; sent rows are deleted, `dead` ones kept."""
+    __tablename__ = "mail_outbox"
+
+    id              = Column(Integer, primary_key=True)
+    to_email        = Column(String, nullable=False)
+    subject         = Column(String, nullable=False)
+    plain           = Column(Text, nullable=False)
+    html            = Column(Text, nullable=False)
+    status          = Column(String(16), nullable=False, default="pending")  # pending | dead
+    attempts        = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_error      = Column(Text)
+    created_at      = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+Index("ix_mail_outbox_due", MailOutbox.status, MailOutbox.next_attempt_at)
+
+
+class DriveExport(Base):
+    """Progress of a /save-to-drive job, readable by every worker; the upload itself stays in its worker."""
+    __tablename__ = "drive_exports"
+
+    id          = Column(String(32), primary_key=True)
+    owner       = Column(String, nullable=False)
+    folder_id   = Column(String, nullable=False)
+    status      = Column(String(16), nullable=False, default="queued")
+    attempts    = Column(Integer, nullable=False, default=0)
+    file_id     = Column(String)
+    file_name   = Column(String)
+    error       = Column(Text)
+    http_status = Column(Integer)
+    retry_at    = Column(DateTime(timezone=True))
+    created_at  = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    finished_at = Column(DateTime(timezone=True))
+    updated_at  = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
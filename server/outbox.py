@@ -0,0 +1,202 @@
+"""
+server/outbox.py
+Durable outbox for transactional mail (verification PINs, reset codes, alerts).
+
+`enqueue()` adds a message to `mail_outbox` in the caller's transaction, so
+sign-up and password-reset requests no longer wait on SendGrid, and a code
+is mailed if and only if the row that makes it valid is committed.  A `MailDispatcher` per
+worker claims due rows in batches of `MAIL_BATCH` (FOR UPDATE SKIP LOCKED:
+workers never grab the same row) and posts them on `MAIL_WORKERS` sender
+threads, each keeping one HTTPS connection to SendGrid alive between sends.
+
+Delivered rows are deleted – they hold one-time codes.  429s, 5xx, auth
+errors and network errors are retried with jittered exponential backoff; a
+message that still fails after `MAIL_MAX_ATTEMPTS`, or that SendGrid rejects
+outright, stays in the table as `dead` with its last error (the dead-letter
+queue) – and with its body blanked, so no live code sits there.
+A claimed row is leased for `MAIL_LEASE_S`: if the worker dies mid-send it
+becomes due again, so delivery is at-least-once.
+"""
+
+import os, json, random, asyncio, logging, datetime, threading, http.client
+from concurrent.futures import ThreadPoolExecutor
+
+from sendgrid.helpers.mail import Mail
+from sqlalchemy import delete, event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from server.db import AsyncSessionLocal
+from server.metrics import Counter
+from server.models import MailOutbox
+
+logger = logging.getLogger(__name__)
+
+# ── Settings ────────────────────────────────────────────────────────────────
+MAIL_BATCH         = int(os.getenv("MAIL_BATCH", 50))              # rows claimed per round
+MAIL_WORKERS       = int(os.getenv("MAIL_WORKERS", 2))             # sender threads / open connections
+MAIL_POLL_S        = float(os.getenv("MAIL_POLL_S", 5))            # for retries and other workers' mail
+MAIL_MAX_ATTEMPTS  = int(os.getenv("MAIL_MAX_ATTEMPTS", 8))
+MAIL_BACKOFF_S     = float(os.getenv("MAIL_BACKOFF_S", 30))        # first retry delay, doubled each time…
+MAIL_BACKOFF_MAX_S = float(os.getenv("MAIL_BACKOFF_MAX_S", 3600))  # …up to this
+MAIL_LEASE_S       = int(os.getenv("MAIL_LEASE_S", 120))
+MAIL_TIMEOUT_S     = int(os.getenv("MAIL_TIMEOUT_S", 15))
+
+SENDGRID_HOST = "api.sendgrid.com"
+
+QUEUED = Counter("mail_queued_total", "Messages put in the mail outbox.")
+SENT   = Counter("mail_sent_total", "Messages delivered to SendGrid.")
+FAILED = Counter("mail_failed_total", "Failed sends, by outcome (retry/dead).")
+
+_wake = asyncio.Event()  # set when enqueued mail commits: this worker's dispatcher looks right away
+
+
+class MailError(Exception):
+    def __init__(self, message: str, retry: bool):
+        super().__init__(message)
+        self.retry = retry
+
+
+def _committed(session) -> None:
+    queued = session.info.pop("outbox_queued", 0)
+    if queued:
+        QUEUED.inc(queued)
+        _wake.set()
+
+
+def _rolled_back(session) -> None:
+    session.info.pop("outbox_queued", None)
+
+
+def enqueue(db: AsyncSession, to_email: str, subject: str, plain: str, html: str | None = None) -> None:
+    """Add a message to `db`'s transaction: it goes out once the caller commits, never if it rolls back."""
+    db.add(MailOutbox(to_email=to_email, subject=subject, plain=plain, html=html or plain))
+    session = db.sync_session
+    if not event.contains(session, "after_commit", _committed):
+        event.listen(session, "after_commit", _committed)
+        event.listen(session, "after_rollback", _rolled_back)
+    session.info["outbox_queued"] = session.info.get("outbox_queued", 0) + 1
+
+
+def _backoff(attempts: int) -> float:
+    return min(MAIL_BACKOFF_MAX_S, MAIL_BACKOFF_S * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+
+
+class MailDispatcher:
+    def __init__(self, api_key: str, sender: str, workers: int = MAIL_WORKERS):
+        self.api_key = api_key
+        self.sender  = sender
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="mail")
+        self._local = threading.local()
+        self._task: asyncio.Task | None = None
+
+    # ── sender threads ─────────────────────────────────────────────────────
+    def _post(self, payload: dict) -> None:
+        body = json.dumps(payload)
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        for fresh in (False, True):
+            conn = getattr(self._local, "conn", None)
+            reused = conn is not None
+            if conn is None:
+                conn = self._local.conn = http.client.HTTPSConnection(SENDGRID_HOST, timeout=MAIL_TIMEOUT_S)
+            try:
+                conn.request("POST", "/v3/mail/send", body, headers)
+                resp = conn.getresponse()
+                data = resp.read()
+                break
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                self._local.conn = None
+                if fresh or not reused:  # a kept-alive connection the server already closed gets one redo
+                    raise MailError(f"network error: {e}", retry=True)
+        if resp.status >= 300:
+            raise MailError(
+                f"SendGrid {resp.status}: {data[:300].decode(errors='replace')}",
+                retry=resp.status in (401, 403, 429) or resp.status >= 500,  # 401/403: key fixed → recovers
+            )
+
+    async def _send(self, row: MailOutbox) -> MailError | None:
+        message = Mail(
+            from_email=self.sender,
+            to_emails=row.to_email,
+            subject=row.subject,
+            plain_text_content=row.plain,
+            html_content=row.html,
+        )
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._post, message.get())
+            logger.info(f"Mail {row.id} sent to {row.to_email!r}: {row.subject!r}")
+            return None
+        except MailError as e:
+            return e
+        except Exception as e:
+            return MailError(str(e), retry=True)
+
+    # ── dispatch loop ──────────────────────────────────────────────────────
+    async def dispatch(self) -> int:
+        """Send one batch of due mail; returns how many rows were claimed."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        async with AsyncSessionLocal() as db:
+            rows = (await db.scalars(
+                select(MailOutbox)
+                .where(MailOutbox.status == "pending", MailOutbox.next_attempt_at <= now)
+                .order_by(MailOutbox.next_attempt_at)
+                .limit(MAIL_BATCH)
+                .with_for_update(skip_locked=True)
+            )).all()
+            if not rows:
+                return 0
+            for row in rows:
+                row.attempts += 1
+                row.next_attempt_at = now + datetime.timedelta(seconds=MAIL_LEASE_S)
+            await db.commit()
+
+        errors = await asyncio.gather(*(self._send(row) for row in rows))
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        async with AsyncSessionLocal() as db:
+            sent = [row.id for row, error in zip(rows, errors) if error is None]
+            if sent:
+                await db.execute(delete(MailOutbox).where(MailOutbox.id.in_(sent)))
+                SENT.inc(len(sent))
+            for row, error in zip(rows, errors):
+                if error is None:
+                    continue
+                row = await db.merge(row, load=False)
+                row.last_error = str(error)[:2000]
+                if error.retry and row.attempts < MAIL_MAX_ATTEMPTS:
+                    row.next_attempt_at = now + datetime.timedelta(seconds=_backoff(row.attempts))
+                    FAILED.inc(outcome="retry")
+                    logger.warning(f"Mail {row.id} to {row.to_email!r} failed (attempt {row.attempts}): {error}")
+                else:
+                    row.status = "dead"
+                    row.plain = row.html = ""  # may hold a one-time code; the error is what's worth keeping
+                    FAILED.inc(outcome="dead")
+                    logger.error(f"Mail {row.id} to {row.to_email!r} dead-lettered after {row.attempts} attempts: {error}")
+            await db.commit()
+        return len(rows)
+
+    async def _run(self) -> None:
+        while True:
+            _wake.clear()
+            try:
+                claimed = await self.dispatch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Mail dispatch failed ({e}); retrying in {MAIL_POLL_S:g}s")
+                claimed = 0
+            if claimed < MAIL_BATCH:  # caught up: wait for new mail or the next poll
+                try:
+                    await asyncio.wait_for(_wake.wait(), MAIL_POLL_S)
+                except asyncio.TimeoutError:
+                    pass
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="mail-dispatcher")
+
+    async def stop(self) -> None:
+        """Unsent mail stays in the outbox for the next start (or another worker)."""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,117 @@
+"""
+server/pages.py
+In-memory cache of the server-rendered pages (/, /docs-page, /privacy, /terms).
+
+None of these pages depend on the request, yet each hit re-rendered the
+1,500-line base template through Jinja and, for the legal pages, re-read and
+re-converted the markdown.  Pages are now rendered once – `warm()` does it at
+startup – and kept as bytes with a strong ETag, so a hit is a dict lookup and
+a browser revalidating with `If-None-Match` gets an empty 304.
+
+A page is rebuilt when any template, or its markdown file, changes on disk:
+their mtimes are compared at most every `PAGE_RECHECK_S` seconds (0 = on
+every request).
+"""
+
+import os, time, hashlib, logging
+from pathlib import Path
+from dataclasses import dataclass
+
+import markdown
+from fastapi import Request, Response
+from jinja2 import Environment
+
+from server.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# ── Settings ────────────────────────────────────────────────────────────────
+PAGE_RECHECK_S = float(os.getenv("PAGE_RECHECK_S", 2))  # how stale a page may get after an edit
+
+SERVED = Counter("page_cache_responses_total", "Cached page responses by result (hit/rendered/not_modified).")
+
+
+def render_markdown(path: Path) -> str:
+    text = path.read_text(encoding="utf-8")
+    # you can also use `marked.js` on the client, but here we do it server‑side
+    return markdown.markdown(text, extensions=["fenced_code", "tables"])
+
+
+@dataclass
+class _PageSpec:
+    template: str
+    markdown: Path | None
+    context: dict
+
+
+@dataclass
+class _Page:
+    body: bytes
+    etag: str
+    mtimes: tuple
+    checked: float
+
+
+class PageCache:
+    def __init__(self, env: Environment, templates_dir: Path, recheck_s: float = PAGE_RECHECK_S):
+        self.env = env
+        self.templates_dir = templates_dir
+        self.recheck_s = recheck_s
+        self._specs: dict[str, _PageSpec] = {}
+        self._pages: dict[str, _Page] = {}
+
+    def add(self, name: str, template: str, markdown: Path | None = None, **context) -> None:
+        """Register page `name`: `template` rendered with `context` (+ `markdown_content`)."""
+        self._specs[name] = _PageSpec(template, markdown, context)
+
+    def _mtimes(self, spec: _PageSpec) -> tuple:
+        # every template: pages extend and include each other
+        files = sorted(self.templates_dir.rglob("*.html"))
+        if spec.markdown:
+            files.append(spec.markdown)
+        return tuple(f.stat().st_mtime_ns for f in files)
+
+    def _render(self, name: str) -> _Page:
+        spec = self._specs[name]
+        mtimes = self._mtimes(spec)  # before reading, so an edit during the render is picked up next time
+        context = dict(spec.context)
+        if spec.markdown:
+            context["markdown_content"] = render_markdown(spec.markdown)
+        body = self.env.get_template(spec.template).render(context).encode("utf-8")
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        return _Page(body, etag, mtimes, time.monotonic())
+
+    def get(self, name: str) -> tuple[_Page, bool]:
+        """(page, rendered now).  Raises FileNotFoundError for a missing markdown file."""
+        page = self._pages.get(name)
+        now = time.monotonic()
+        if page is not None and now - page.checked < self.recheck_s:
+            return page, False
+        if page is not None:
+            try:
+                fresh = self._mtimes(self._specs[name]) == page.mtimes
+            except FileNotFoundError:
+                fresh = False
+            if fresh:
+                page.checked = now
+                return page, False
+            self._pages.pop(name, None)
+        page = self._pages[name] = self._render(name)
+        return page, True
+
+    def respond(self, request: Request, name: str) -> Response:
+        page, rendered = self.get(name)
+        headers = {"ETag": page.etag, "Cache-Control": "no-cache"}  # revalidate, usually → 304
+        inm = request.headers.get("if-none-match")
+        if inm and (inm.strip() == "*" or page.etag in (t.strip() for t in inm.split(","))):
+            SERVED.inc(result="not_modified")
+            return Response(status_code=304, headers=headers)
+        SERVED.inc(result="rendered" if rendered else "hit")
+        return Response(page.body, media_type="text/html; charset=utf-8", headers=headers)
+
+    def warm(self) -> None:
+        for name in self._specs:
+            try:
+                self.get(name)
+            except Exception as e:
+                logger.warning(f"Could not pre-render page {name!r}: {e}")
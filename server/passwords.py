@@ -0,0 +1,75 @@
+"""
+server/passwords.py
+bcrypt hashing off the event loop.
+
+A bcrypt hash or verify burns ~250 ms of CPU; run inline, a burst of logins
+at the start of a lecture would freeze every live /ws/stt socket.  Both run
+on a small dedicated thread pool instead (bcrypt releases the GIL), with at
+most `PASSWORD_HASH_QUEUE` calls waiting: beyond that `HasherBusy` is raised
+and the endpoint answers 503 rather than queueing logins for ever.
+
+The work factor is `BCRYPT_ROUNDS`.  Hashes made with another factor still
+verify, and `verify_password()` hands back a replacement hash so callers can
+upgrade them on a successful login.
+"""
+
+import os, time, asyncio, logging
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+from server.metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# ── Settings ────────────────────────────────────────────────────────────────
+BCRYPT_ROUNDS         = int(os.getenv("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))   # threads, ≤ CPU cores to spare
+PASSWORD_HASH_QUEUE   = int(os.getenv("PASSWORD_HASH_QUEUE", 32))    # hashes waiting, then 503
+
+_pwd_ctx  = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+_executor = ThreadPoolExecutor(PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_inflight = 0  # running + waiting
+
+HASHES   = Counter("password_hashes_total", "bcrypt operations by kind (hash/verify).")
+SECONDS  = Counter("password_hash_seconds_total", "CPU-bound time spent in bcrypt, by kind.")
+REJECTED = Counter("password_hash_rejected_total", "bcrypt operations refused because the queue was full.")
+Gauge("password_hash_inflight", "bcrypt operations running or waiting for a thread.", lambda: _inflight)
+
+
+class HasherBusy(Exception):
+    """Too many password hashes already queued."""
+
+
+async def _run(kind: str, fn, *args):
+    global _inflight
+    if _inflight >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE:
+        REJECTED.inc(kind=kind)
+        raise HasherBusy()
+
+    def timed():
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            SECONDS.inc(time.perf_counter() - start, kind=kind)
+
+    _inflight += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, timed)
+    finally:
+        _inflight -= 1
+        HASHES.inc(kind=kind)
+
+
+async def hash_password(password: str) -> str:
+    return await _run("hash", _pwd_ctx.hash, password)
+
+
+async def verify_password(password: str, hashed: str) -> tuple[bool, str | None]:
+    """(matches, new hash when the stored one should be upgraded, else None)."""
+    return await _run("verify", _pwd_ctx.verify_and_update, password, hashed)
+
+
+def shutdown() -> None:
+    _executor.shutdown(wait=False, cancel_futures=True)
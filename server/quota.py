@@ -2,14 +2,14 @@
 Quota enforcement for /summarize and similar endpoints.
 """
 
-from typing import Annotated
+from typing import Annotated, AsyncIterator
 
-from fastapi             import Depends, HTTPException, status, Cookie
+from fastapi             import Depends, HTTPException, Request, status, Cookie
 from sqlalchemy.ext.asyncio import AsyncSession
-from server.models import Role, user_roles
-from sqlalchemy import select
 from .db    import get_db
-from .crud  import get_user_by_username, DEFAULT_PLANS
+from .crud  import DEFAULT_PLANS
+from .user_context import UserContext, load_user_context
+from .ledger import Reservation, quota_ledger
 
 
 # --------------------------------------------------------------------------- #
@@ -17,6 +17,7 @@ from .crud  import get_user_by_username, DEFAULT_PLANS
 # while the import graph is still being built – avoids the circular import.   #
 # --------------------------------------------------------------------------- #
 async def _current_user_from_cookie(
+    request: Request,
     access_token: Annotated[str | None, Cookie()] = None,
 ):
     if not access_token:
@@ -32,7 +33,24 @@ async def _current_user_from_cookie(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
     )
-    return verify_token(access_token, cred_exc)
+    return verify_token(access_token, cred_exc, request.state)
+
+
+# --------------------------------------------------------------------------- #
+# request-scoped user context: one (usually cached) lookup per request        #
+# --------------------------------------------------------------------------- #
+async def current_user_context(
+    request: Request,
+    current_user: Annotated[str, Depends(_current_user_from_cookie)],
+    db: AsyncSession = Depends(get_db),
+) -> UserContext:
+    ctx = getattr(request.state, "user_ctx", None)
+    if ctx is None:
+        ctx = await load_user_context(db, current_user)
+        if ctx is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+        request.state.user_ctx = ctx
+    return ctx
 
 
 # ---------------------------- plan helpers --------------------------------- #
@@ -40,30 +58,33 @@ _PLAN_MAP  : dict[str, dict] = {p["name"]: p for p in DEFAULT_PLANS}
 _FREE_PLAN = _PLAN_MAP["free"]
 
 
+def plan_for(user: UserContext) -> dict:
+    return _PLAN_MAP.get(user.subscription_plan, _FREE_PLAN)
+
+
+def remaining(user: UserContext) -> int:
+    return plan_for(user)["quota"] - quota_ledger.used(user)
+
+
 async def enforce_quota(
-    current_user: Annotated[str, Depends(_current_user_from_cookie)],
-    db: AsyncSession = Depends(get_db),
-):
-    # 1) look up the User ORM
-    user = await get_user_by_username(db, current_user)
-
-    # 2) check if they have the “admin” role
-    row = await db.execute(
-        select(Role.name)
-        .select_from(Role)
-        .join(user_roles, user_roles.c.role_id == Role.id)
-        .where(user_roles.c.user_id == user.id)
-    )
-    roles = {r[0] for r in row.all()}
-    if "admin" in roles:
-        return user  # admins are unlimited
+    user: Annotated[UserContext, Depends(current_user_context)],
+) -> AsyncIterator[Reservation]:
+    # 1) user + roles come from the request's user context (one query, or none when cached)
+    # 2) admins are unlimited, but their calls are still counted and logged
+    limit = None if user.is_admin else plan_for(user)["quota"]
 
-    # 3) otherwise, enforce the normal plan/quota
-    plan = _PLAN_MAP.get(user.subscription_plan, _FREE_PLAN)
-    if user.summarize_call_count >= plan["quota"]:
+    # 3) reserve one call from the in-memory ledger – the endpoint charges it
+    #    on success; anything else (a 400, an OpenAI error) releases it here,
+    #    unless the endpoint `keep()`s it for a response that outlives it
+    reservation = quota_ledger.reserve(user, limit)
+    if reservation is None:
         raise HTTPException(
             status_code=status.HTTP_402_PAYMENT_REQUIRED,
             detail=f"Quota exceeded for {user.subscription_plan} plan.",
         )
 
-    return user
\ No newline at end of file
+    try:
+        yield reservation
+    finally:
+        if not reservation.kept:
+            reservation.release()
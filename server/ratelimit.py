@@ -0,0 +1,198 @@
+"""
+server/ratelimit.py
+Per-user rate limits for expensive endpoints (/summarize …).
+
+Limits use the familiar "5/minute;100/day" syntax and are counted with a
+sliding-window counter: the current fixed window plus the previous one,
+weighted by how much of it still overlaps the sliding window.  It takes O(1)
+state per key and limit, and no burst at window edges.  Backends
+(`RATE_LIMIT_BACKEND`):
+
+* ``memory`` – a dict in this process (default); a check costs a few µs, but
+  each uvicorn worker counts on its own.
+* ``redis``  – one atomic Lua call to the Redis-compatible server at
+  `RATE_LIMIT_REDIS_URL`, shared by all workers (needs the `redis` package).
+  If the server is unreachable, each worker falls back to counting in its own
+  memory until it is back – limits loosen to per-worker, but still hold – and
+  the failures show up in `rate_limit_backend_errors_total`.
+
+The key is the user id from the request's user context, which the endpoint
+needs anyway – no second token check, no IP guessing behind proxies.
+"""
+
+import os, re, math, time, logging
+from typing import Annotated
+
+from fastapi import Depends, HTTPException, status
+
+from server.metrics import Counter
+from server.quota import current_user_context
+from server.user_context import UserContext
+
+try:
+    import redis.asyncio as aioredis
+except Exception:  # optional: only the redis backend needs it
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+# ── Settings ────────────────────────────────────────────────────────────────
+RATE_LIMIT_BACKEND   = os.getenv("RATE_LIMIT_BACKEND", "memory")     # "memory" | "redis"
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+RATE_LIMIT_MAX_KEYS  = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100_000))  # memory backend, before a sweep
+
+CHECKS = Counter("rate_limit_checks_total", "Rate limit checks by scope and result (allowed/limited).")
+ERRORS = Counter("rate_limit_backend_errors_total", "Shared-backend failures, by scope; those checks were counted in memory.")
+
+_UNITS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+_LIMIT_RE = re.compile(r"^\s*(\d+)\s*(?:/|per)\s*(\d+)?\s*(second|minute|hour|day)s?\s*$")
+
+
+def parse_limits(spec: str) -> list[tuple[int, int]]:
+    """ "5/minute;100/day" → [(5, 60), (100, 86400)] """
+    limits = []
+    for part in filter(None, (p.strip() for p in re.split(r"[;,]", spec))):
+        m = _LIMIT_RE.match(part)
+        if not m:
+            raise ValueError(f"bad rate limit {part!r}")
+        limits.append((int(m[1]), int(m[2] or 1) * _UNITS[m[3]]))
+    return limits
+
+
+def _retry_after(count: int, period: int, now: float, prev: int, cur: int) -> float:
+    """Seconds until prev·weight + cur + 1 fits in `count` again."""
+    start = now // period * period
+    if cur + 1 > count:  # not before the current window has become the previous one
+        overlap = max(0.0, 1 - (count - 1) / cur) if cur else 0.0
+        return start + period + overlap * period - now
+    if not prev:
+        return 0.0
+    overlap = 1 - (count - 1 - cur) / prev
+    return max(0.0, start + overlap * period - now)
+
+
+class MemoryBackend:
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._windows: dict[tuple[str, int], list[int]] = {}  # (key, period) → [window no, previous, current]
+
+    async def hit(self, key: str, limits: list[tuple[int, int]]) -> float | None:
+        now = time.time()
+        counted = []
+        for count, period in limits:  # all limits are checked before any is counted
+            idx = int(now // period)
+            w = self._windows.get((key, period))
+            if w is None:
+                if len(self._windows) >= self.max_keys:
+                    self._sweep(now)
+                w = self._windows[(key, period)] = [idx, 0, 0]
+            elif w[0] != idx:
+                w[0], w[1], w[2] = idx, (w[2] if w[0] == idx - 1 else 0), 0
+            weight = 1 - (now - idx * period) / period
+            if w[1] * weight + w[2] + 1 > count:
+                return _retry_after(count, period, now, w[1], w[2])
+            counted.append(w)
+        for w in counted:
+            w[2] += 1
+        return None
+
+    def _sweep(self, now: float) -> None:
+        for (key, period), w in list(self._windows.items()):
+            if w[0] < now // period - 1:  # nothing left in its sliding window
+                del self._windows[(key, period)]
+
+    async def close(self) -> None:
+        pass
+
+
+# KEYS[1] = key prefix; ARGV = now, count₁, period₁, count₂, period₂ …
+_SLIDING_WINDOW_LUA = """
+local now = tonumber(ARGV[1])
+local windows = {}
+for i = 1, (#ARGV - 1) / 2 do
+  local count, period = tonumber(ARGV[2 * i]), tonumber(ARGV[2 * i + 1])
+  local idx = math.floor(now / period)
+  local base = KEYS[1] .. ':' .. period .. ':'
+  local cur = tonumber(redis.call('GET', base .. idx) or '0')
+  local prev = tonumber(redis.call('GET', base .. (idx - 1)) or '0')
+  if prev * (1 - (now - idx * period) / period) + cur + 1 > count then
+    return {i, prev, cur}
+  end
+  windows[i] = {base .. idx, period}
+end
+for _, w in ipairs(windows) do
+  redis.call('INCR', w[1])
+  redis.call('EXPIRE', w[1], 2 * w[2])
+end
+return {0}
+"""
+
+
+class RedisBackend:
+    def __init__(self, url: str = RATE_LIMIT_REDIS_URL):
+        if aioredis is None:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis needs the 'redis' package")
+        self._redis  = aioredis.from_url(url)
+        self._script = self._redis.register_script(_SLIDING_WINDOW_LUA)
+
+    async def hit(self, key: str, limits: list[tuple[int, int]]) -> float | None:
+        now = time.time()
+        args = [repr(now)] + [str(v) for limit in limits for v in limit]
+        res = await self._script(keys=[f"rl:{key}"], args=args)
+        if not res[0]:
+            return None
+        count, period = limits[int(res[0]) - 1]
+        return _retry_after(count, period, now, int(res[1]), int(res[2]))
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+class RateLimiter:
+    """Front for the configured backend; while a shared backend fails, checks are counted in memory."""
+
+    def __init__(self, backend: str = RATE_LIMIT_BACKEND):
+        if backend not in ("memory", "redis"):
+            raise ValueError(f"unknown RATE_LIMIT_BACKEND {backend!r}")
+        self.backend  = MemoryBackend() if backend == "memory" else RedisBackend()
+        self.fallback = MemoryBackend()
+        self._failing = False
+
+    async def hit(self, scope: str, key: str, limits: list[tuple[int, int]]) -> float | None:
+        """None when allowed (and counted), else seconds until it would be."""
+        try:
+            retry = await self.backend.hit(f"{scope}:{key}", limits)
+        except Exception as e:
+            ERRORS.inc(scope=scope)
+            if not self._failing:  # once per outage, not per request
+                logger.warning(f"Rate limit backend failed ({e}); counting in this worker's memory until it is back")
+                self._failing = True
+            retry = await self.fallback.hit(f"{scope}:{key}", limits)
+        else:
+            if self._failing:
+                logger.info("Rate limit backend is back")
+                self._failing = False
+        CHECKS.inc(scope=scope, result="allowed" if retry is None else "limited")
+        return retry
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+
+rate_limiter = RateLimiter()
+
+
+def rate_limit(scope: str, spec: str, message: str):
+    """Dependency enforcing `spec` per user; declare it before anything that spends (e.g. quota)."""
+    limits = parse_limits(spec)
+
+    async def check(user: Annotated[UserContext, Depends(current_user_context)]) -> None:
+        retry = await rate_limiter.hit(scope, str(user.id), limits)
+        if retry is not None:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=message,
+                headers={"Retry-After": str(max(1, math.ceil(retry)))},
+            )
+
+    return check
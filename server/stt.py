@@ -0,0 +1,627 @@
+"""
+server/stt.py
+Off-event-loop Vosk decoding engine for /ws/stt.
+
+Every `KaldiRecognizer` lives on one decoding worker for its whole life
+(per-session affinity), so the CPU-bound `AcceptWaveform` calls never run on
+the uvicorn event loop.  Per session the pipeline is:
+
+  socket frames ─► coalesce into `STT_BLOCK_MS` blocks (on the loop)
+                ─► bounded queue (`STT_QUEUE_MAX`; when full, `feed()` waits,
+                   we stop reading the socket and the browser is throttled by
+                   ordinary WebSocket/TCP backpressure)
+                ─► worker: codec (PCM / µ-law / Opus, negotiated in the first
+                   control message) → resample to `STT_MODEL_RATE` → energy
+                   VAD gate (silence is never decoded; a final result is
+                   flushed when speech stops) → recognizer
+                ─► `PartialPolicy` (rate cap with trailing flush, unchanged-
+                   suppression, deltas)
+                ─► socket
+
+Recognizers are reset and reused across sessions (per shard, keyed by rate
+and options), so reconnect storms don't rebuild a decoder every time.
+
+Sessions survive a dropped socket: the server hands out a session id, and on
+an abnormal close parks the session (recognizer, undecoded blocks and the last
+`STT_RESUME_AUDIO_S` of audio since the last final) for `STT_RESUME_GRACE_S`.
+A reconnecting client sends ``{"type": "config", "resume": id}``, learns how
+many frames the server already has (`seq`) and re-sends only the rest.  If the
+shard died in the meantime the kept audio is replayed on a fresh recognizer.
+
+Two backends share the same shard interface (`STT_BACKEND`):
+
+* ``thread``  – N decoding threads inside the uvicorn process (default).
+* ``process`` – this process acts as supervisor and forks N decoder processes
+  *after* the model is loaded.  Vosk has no mmap loader, but the children
+  inherit the model pages copy-on-write and Kaldi only reads them while
+  decoding, so all shards share one physical copy of the model.  Sessions
+  talk to their shard over a local pipe.
+"""
+
+import os, json, time, queue, signal, asyncio, secrets, itertools, logging, threading
+import multiprocessing as mp
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable
+
+from vosk import KaldiRecognizer
+
+from server.audio import EnergyVad, FrameDecoder, Resampler, available_codecs, check_rate, frame_seconds
+
+logger = logging.getLogger(__name__)
+
+# ── Settings ────────────────────────────────────────────────────────────────
+STT_BACKEND   = os.getenv("STT_BACKEND", "thread")                  # "thread" | "process"
+STT_WORKERS   = int(os.getenv("STT_WORKERS", os.cpu_count() or 4))  # decoding threads/processes
+STT_QUEUE_MAX = int(os.getenv("STT_QUEUE_MAX", 64))  # blocks buffered per session
+STT_BLOCK_MS  = int(os.getenv("STT_BLOCK_MS", 200))  # coalesce frames into 100–250 ms blocks
+STT_MODEL_RATE = int(os.getenv("STT_MODEL_RATE", 16_000))  # rate the model was trained at
+STT_PARTIAL_MIN_INTERVAL_MS = int(os.getenv("STT_PARTIAL_MIN_INTERVAL_MS", 250))  # partial rate cap
+STT_PARTIAL_DELTAS = os.getenv("STT_PARTIAL_DELTAS", "1") == "1"  # allow clients to opt into deltas
+STT_VAD = os.getenv("STT_VAD", "1") == "1"  # skip decoding silence unless a session opts out
+STT_VAD_THRESHOLD_DB = float(os.getenv("STT_VAD_THRESHOLD_DB", -45))
+STT_VAD_HANGOVER_MS  = int(os.getenv("STT_VAD_HANGOVER_MS", 600))
+STT_POOL_MAX    = int(os.getenv("STT_POOL_MAX", 8))      # idle recognizers kept per shard and key
+STT_POOL_IDLE_S = int(os.getenv("STT_POOL_IDLE_S", 300))  # drop idle recognizers after this long
+STT_RESUME_GRACE_S = int(os.getenv("STT_RESUME_GRACE_S", 30))  # keep a dropped session this long
+STT_RESUME_AUDIO_S = float(os.getenv("STT_RESUME_AUDIO_S", 10))  # audio kept for replay on shard loss
+
+Emit = Callable[[dict], Awaitable[None]]
+
+
+# ── Decoder host (runs on the worker, never on the event loop) ──────────────
+def _make_vad(opts) -> EnergyVad | None:
+    """`opts` is a session's ``vad`` setting: None (server default), bool or a dict."""
+    if opts is None:
+        opts = STT_VAD
+    if not opts:
+        return None
+    opts = opts if isinstance(opts, dict) else {}
+    try:
+        threshold_db = min(-10.0, max(-80.0, float(opts.get("threshold_db", STT_VAD_THRESHOLD_DB))))
+        hangover_ms  = min(5000, max(200, int(opts.get("hangover_ms", STT_VAD_HANGOVER_MS))))
+    except (TypeError, ValueError):
+        threshold_db, hangover_ms = STT_VAD_THRESHOLD_DB, STT_VAD_HANGOVER_MS
+    return EnergyVad(STT_MODEL_RATE, threshold_db=threshold_db, hangover_ms=hangover_ms)
+
+
+class _Decoder:
+    """Per-session decode state: codec → resampler → VAD gate → recognizer."""
+
+    def __init__(self, rec: KaldiRecognizer, codec: str, sample_rate: int, vad=None):
+        self.frames    = FrameDecoder(codec, sample_rate, STT_MODEL_RATE)
+        self.resampler = Resampler(self.frames.rate, STT_MODEL_RATE)
+        self.vad       = _make_vad(vad)
+        self.rec       = rec
+        self._speaking = False
+        self._preroll  = b""   # last silent block, replayed at speech onset
+
+    def accept(self, frames: list[bytes]) -> dict | None:
+        rec = self.rec
+        pcm = self.resampler.process(self.frames.decode(frames))
+        if self.vad and not self.vad.is_speech(pcm):
+            self._preroll = pcm
+            if not self._speaking:
+                return None                     # silence: nothing to decode
+            self._speaking = False              # speech just ended: flush the utterance
+            text = json.loads(rec.FinalResult())["text"]
+            return {"text": text} if text else None
+        if not self._speaking:
+            self._speaking = True
+            pcm, self._preroll = self._preroll + pcm, b""
+        if rec.AcceptWaveform(pcm):
+            return {"text": json.loads(rec.Result())["text"]}
+        return {"partial": json.loads(rec.PartialResult())["partial"]}
+
+
+class RecognizerPool:
+    """
+    Idle recognizers of one worker, keyed by (sample rate, options).  Building a
+    `KaldiRecognizer` allocates a fresh decoding graph; `Reset()` on a returned
+    one is far cheaper, so sessions borrow from here and give them back on close.
+    """
+
+    KEY = (STT_MODEL_RATE, "words")
+
+    def __init__(self, model, max_idle: int = STT_POOL_MAX, idle_s: float = STT_POOL_IDLE_S):
+        self.model    = model
+        self.max_idle = max_idle
+        self.idle_s   = idle_s
+        self._idle: dict[tuple, list[tuple[KaldiRecognizer, float]]] = {}
+
+    def acquire(self, key: tuple = KEY) -> KaldiRecognizer:
+        self._evict()
+        if idle := self._idle.get(key):
+            return idle.pop()[0]                  # most recently returned = warmest
+        rate, options = key
+        rec = KaldiRecognizer(self.model, rate)
+        rec.SetWords("words" in options)
+        return rec
+
+    def release(self, rec: KaldiRecognizer, key: tuple = KEY) -> None:
+        self._evict()
+        idle = self._idle.setdefault(key, [])
+        if len(idle) >= self.max_idle:
+            return
+        rec.Reset()
+        idle.append((rec, time.monotonic()))
+
+    def _evict(self) -> None:
+        cutoff = time.monotonic() - self.idle_s
+        for key, idle in list(self._idle.items()):
+            idle[:] = [entry for entry in idle if entry[1] > cutoff]
+            if not idle:
+                del self._idle[key]
+
+
+class DecoderHost:
+    """Owns the decoders pinned to one worker and applies ops to them."""
+
+    def __init__(self, model):
+        self.model = model
+        self.pool  = RecognizerPool(model)
+        self.decoders: dict[int, _Decoder] = {}
+
+    def handle(self, op: str, sid: int, arg=None):
+        if op == "open":
+            old = self.decoders.pop(sid, None)
+            self.decoders[sid] = _Decoder(old.rec if old else self.pool.acquire(), *arg)
+            return None
+        if op == "vad":
+            self.decoders[sid].vad = _make_vad(arg)
+            return None
+        if op == "accept":
+            return self.decoders[sid].accept(arg)
+        if op == "close":
+            dec = self.decoders.pop(sid, None)
+            if dec:
+                self.pool.release(dec.rec)
+            return None
+        raise ValueError(f"unknown decoder op {op!r}")
+
+
+class ThreadShard:
+    """One dedicated decoding thread; all its recognizers are used from it only."""
+
+    alive = True
+
+    def __init__(self, idx: int, model):
+        self.idx      = idx
+        self.sessions: set[int] = set()
+        self._host    = DecoderHost(model)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"stt-{idx}")
+
+    async def call(self, op: str, sid: int, arg=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._host.handle, op, sid, arg)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _shard_main(conn, model) -> None:
+    """Decoder process loop: apply ops from the supervisor until told to stop."""
+    # leave signal handling to the supervisor (uvicorn's wakeup fd is shared)
+    signal.set_wakeup_fd(-1)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    host = DecoderHost(model)
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        if msg is None:
+            break
+        req, op, sid, arg = msg
+        try:
+            reply = (req, host.handle(op, sid, arg), None)
+        except Exception as e:
+            reply = (req, None, repr(e))
+        conn.send(reply)
+
+
+def _settle(fut: asyncio.Future, result, error: str | None) -> None:
+    if fut.done():
+        return
+    if error:
+        fut.set_exception(RuntimeError(error))
+    else:
+        fut.set_result(result)
+
+
+class ProcessShard:
+    """A forked decoder process; ops are written to a pipe and replies read from it on threads."""
+
+    def __init__(self, idx: int, model):
+        self.idx      = idx
+        self.sessions: set[int] = set()
+        self._model   = model
+        self._req_ids = itertools.count()
+        self._spawn()
+
+    def _spawn(self) -> None:
+        parent_conn, child_conn = mp.get_context("fork").Pipe()
+        self._proc = mp.get_context("fork").Process(
+            target=_shard_main, args=(child_conn, self._model),
+            name=f"stt-shard-{self.idx}", daemon=True,
+        )
+        self._proc.start()
+        child_conn.close()
+        self._conn = parent_conn
+        # per process: the threads of a dead one only ever fail the requests it had
+        self._pending: dict[int, asyncio.Future] = {}
+        self._outbox: queue.SimpleQueue = queue.SimpleQueue()
+        threading.Thread(
+            target=self._write_requests, args=(parent_conn, self._outbox, self._pending),
+            name=f"stt-shard-{self.idx}-writer", daemon=True,
+        ).start()
+        threading.Thread(
+            target=self._read_replies, args=(parent_conn, self._pending),
+            name=f"stt-shard-{self.idx}-reader", daemon=True,
+        ).start()
+        logger.info(f"STT shard {self.idx} started (pid={self._proc.pid})")
+
+    @property
+    def alive(self) -> bool:
+        return self._proc.is_alive()
+
+    def restart(self) -> None:
+        # Unlike the first fork at startup, this one happens with HTTP, batch
+        # transcription and the other shards' threads running: a lock one of
+        # them holds at that instant stays held in the child.  The child only
+        # touches its pipe and the model, so in practice that is Kaldi/BLAS
+        # state shared with /transcribe threads – a replacement hung that way
+        # shows up as a shard that never answers, and a process restart clears it.
+        logger.warning(f"STT shard {self.idx} died (exit={self._proc.exitcode}); restarting")
+        self._conn.close()
+        self._outbox.put(None)  # stops the old writer
+        self.sessions.clear()
+        self._spawn()
+
+    async def call(self, op: str, sid: int, arg=None):
+        fut = asyncio.get_running_loop().create_future()
+        req = next(self._req_ids)
+        self._pending[req] = fut
+        # a busy shard's full pipe blocks the writer thread, not the event loop
+        self._outbox.put((req, op, sid, arg))
+        return await fut
+
+    def _write_requests(self, conn, outbox: queue.SimpleQueue, pending: dict) -> None:
+        down = False
+        while True:
+            msg = outbox.get()
+            if not down:
+                try:
+                    conn.send(msg)
+                except (OSError, ValueError):
+                    down = True
+            if msg is None:  # shutdown / restart
+                return
+            if down:
+                fut = pending.pop(msg[0], None)
+                if fut:
+                    fut.get_loop().call_soon_threadsafe(_settle, fut, None, f"STT shard {self.idx} is down")
+
+    def _read_replies(self, conn, pending: dict) -> None:
+        while True:
+            try:
+                req, result, error = conn.recv()
+            except (EOFError, OSError):
+                break
+            fut = pending.pop(req, None)
+            if fut:
+                fut.get_loop().call_soon_threadsafe(_settle, fut, result, error)
+        # the shard is gone – fail whatever was still waiting on it
+        for req in list(pending):
+            fut = pending.pop(req, None)
+            if fut:
+                fut.get_loop().call_soon_threadsafe(_settle, fut, None, f"STT shard {self.idx} exited")
+
+    def shutdown(self) -> None:
+        self._outbox.put(None)  # behind whatever is still queued
+        self._proc.join(timeout=5)
+        if self._proc.is_alive():
+            self._proc.terminate()
+
+
+# ── Partial-result emission ─────────────────────────────────────────────────
+class PartialPolicy:
+    """
+    Decides which decoder results actually go out on the socket.
+
+    Finals always pass.  Partials are dropped when unchanged; one that comes
+    less than `min_interval_ms` after the last is held back, and the latest
+    held-back partial goes out by `flush()` once the interval is over – so a
+    speaker pausing mid-phrase still sees their last words.  A final
+    supersedes it.  With `deltas` on partials are sent as
+    ``{"delta": [keep, append]}`` against the last *emitted* partial.
+    """
+
+    def __init__(self, min_interval_ms: int = STT_PARTIAL_MIN_INTERVAL_MS, deltas: bool = False):
+        self.min_interval = min_interval_ms / 1000
+        self.deltas       = deltas
+        self._last        = ""
+        self._last_at     = 0.0
+        self._held: dict | None = None
+
+    def reset(self) -> None:
+        """Forget the last partial, e.g. for a freshly attached client."""
+        self._last, self._last_at, self._held = "", 0.0, None
+
+    def filter(self, msg: dict) -> dict | None:
+        if "partial" not in msg:
+            self._last, self._held = "", None  # the client drops its interim line on a final
+            return msg
+
+        if msg["partial"] == self._last:
+            self._held = None
+            return None
+        if time.monotonic() - self._last_at < self.min_interval:
+            self._held = msg
+            return None
+        return self._out(msg)
+
+    def flush_in(self) -> float | None:
+        """Seconds until the held-back partial is due, None when nothing is held."""
+        if self._held is None:
+            return None
+        return max(0.0, self._last_at + self.min_interval - time.monotonic())
+
+    def flush(self) -> dict | None:
+        """The held-back partial, once it is due."""
+        if self._held is None or self.flush_in() > 0:
+            return None
+        msg, self._held = self._held, None
+        return self._out(msg)
+
+    def _out(self, msg: dict) -> dict:
+        partial = msg["partial"]
+        prev, self._last, self._last_at = self._last, partial, time.monotonic()
+        if not self.deltas:
+            return msg
+        keep = len(os.path.commonprefix((prev, partial)))
+        return {"delta": [keep, partial[keep:]]}
+
+
+# ── Sessions ────────────────────────────────────────────────────────────────
+class SttSession:
+    """A single /ws/stt stream pinned to one shard; outlives its socket while parked."""
+
+    def __init__(
+        self,
+        engine: "SttEngine",
+        shard: "ThreadShard | ProcessShard",
+        sid: int,
+        emit: Emit,
+        owner: str | None = None,
+    ):
+        self.sid     = sid
+        self.token   = secrets.token_urlsafe(16)  # public id a client resumes with
+        self.owner   = owner
+        self._engine = engine
+        self._shard  = shard
+        self._emit: Emit | None = emit           # None while parked
+        self.on_final: Callable[[str], None] | None = None  # sees every final segment, attached or not
+        self._inbox: asyncio.Queue[tuple[int, list[bytes]] | None] = asyncio.Queue(maxsize=engine.queue_max)
+        self._task: asyncio.Task | None = None
+        self._policy  = PartialPolicy()
+        self.codec    = "pcm"
+        self.sample_rate = 0
+        self.vad      = None   # server default
+        self.seq      = 0      # audio frames received, across reconnects
+        self._block: list[bytes] = []
+        self._block_s = 0.0
+        self._blocks  = itertools.count()
+        self._fed     = False
+        self._backlog: list[dict] = []  # finals decoded while no socket was attached
+        self._tail: deque[tuple[int, list[bytes], float]] = deque()  # blocks since the last final
+        self._tail_s  = 0.0
+
+    async def start(self, sample_rate: int) -> None:
+        self.sample_rate = sample_rate
+        await self._shard.call("open", self.sid, (self.codec, sample_rate, self.vad))
+        self._task = asyncio.create_task(self._pump(), name=f"stt-session-{self.sid}")
+
+    async def configure(self, opts: dict) -> dict | None:
+        """Apply a client ``{"type": "config", ...}`` control message; returns the ack."""
+        if "partials" in opts:
+            self._policy.deltas = STT_PARTIAL_DELTAS and opts["partials"] == "delta"
+        if "vad" in opts:
+            self.vad = opts["vad"]
+            await self._shard.call("vad", self.sid, self.vad)
+        if "codec" not in opts:
+            return None
+
+        # the codec can only be chosen before the first audio frame
+        codec = opts["codec"] if opts["codec"] in available_codecs() else "pcm"
+        try:
+            rate = check_rate(opts.get("sample_rate") or self.sample_rate)
+        except ValueError as e:
+            return {"type": "error", "error": str(e)}  # the session keeps its current config
+        if not self._fed and (codec, rate) != (self.codec, self.sample_rate):
+            await self._shard.call("open", self.sid, (codec, rate, self.vad))
+            self.codec, self.sample_rate = codec, rate
+        return {"type": "config", "codec": self.codec}
+
+    async def feed(self, frame: bytes) -> None:
+        """Coalesce a frame and queue full blocks; waits while the session is backed up."""
+        if self._task.done():
+            self._task.result()  # surface the decoder/socket error
+            raise RuntimeError("STT session already closed")
+        self._fed = True
+        self.seq += 1
+        self._block.append(frame)
+        self._block_s += frame_seconds(self.codec, self.sample_rate, frame)
+        if self._block_s * 1000 >= self._engine.block_ms:
+            await self._queue_block()
+
+    async def _queue_block(self) -> None:
+        block, secs = self._block, self._block_s
+        self._block, self._block_s = [], 0.0
+        idx = next(self._blocks)
+        self._tail.append((idx, block, secs))
+        self._tail_s += secs
+        while self._tail_s > self._engine.resume_audio_s and len(self._tail) > 1:
+            self._tail_s -= self._tail.popleft()[2]
+        await self._inbox.put((idx, block))
+
+    async def _pump(self) -> None:
+        inbox = self._inbox
+        try:
+            while True:
+                # no newer result before the rate cap lifts: send the partial it held back
+                wait = self._policy.flush_in()
+                try:
+                    if wait == 0:
+                        raise asyncio.TimeoutError
+                    item = await (inbox.get() if wait is None else asyncio.wait_for(inbox.get(), wait))
+                except asyncio.TimeoutError:
+                    if msg := self._policy.flush():
+                        await self._send(msg)
+                    continue
+                if item is None:
+                    break
+                idx, block = item
+                result = await self._shard.call("accept", self.sid, block)
+                if result and "text" in result:
+                    # the utterance is final: its audio no longer needs replaying
+                    while self._tail and self._tail[0][0] <= idx:
+                        self._tail_s -= self._tail.popleft()[2]
+                    if self.on_final:
+                        self.on_final(result["text"])
+                msg = result and self._policy.filter(result)
+                if msg:
+                    await self._send(msg)
+        finally:
+            # unblock a producer stuck on a full queue so it sees the failure
+            while not inbox.empty():
+                inbox.get_nowait()
+
+    async def _send(self, msg: dict) -> None:
+        if self._emit is not None:
+            try:
+                await self._emit(msg)
+                return
+            except Exception as e:  # socket went away under us; keep decoding
+                logger.debug(f"STT session {self.sid} lost its socket: {e}")
+                self._emit = None
+        if "text" in msg:
+            self._backlog.append(msg)  # partials are stale by the time anyone reattaches
+
+    def detach(self) -> None:
+        self._emit = None
+
+    async def attach(self, emit: Emit) -> None:
+        """Reattach a parked session to a new socket and flush what it missed."""
+        if self._task.done() or not self._shard.alive or self.sid not in self._shard.sessions:
+            await self._rebuild()
+        self._policy.reset()
+        while self._backlog:
+            await emit(self._backlog.pop(0))
+        self._emit = emit
+
+    async def _rebuild(self) -> None:
+        """The shard lost our recognizer: replay the kept audio on a fresh one."""
+        logger.warning(f"STT session {self.sid} lost its decoder; replaying {self._tail_s:.1f}s of audio")
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._shard.sessions.discard(self.sid)
+        self._shard = self._engine._pick_shard()
+        self._shard.sessions.add(self.sid)
+        self._inbox = asyncio.Queue(maxsize=self._engine.queue_max)
+        await self.start(self.sample_rate)
+        for idx, block, _ in list(self._tail):
+            await self._inbox.put((idx, block))
+
+    async def close(self) -> None:
+        try:
+            if self._task and not self._task.done():
+                if self._block:
+                    await self._queue_block()
+                await self._inbox.put(None)
+                await asyncio.gather(self._task, return_exceptions=True)
+        finally:
+            await self._engine.release(self)
+
+
+class SttEngine:
+    """Pool of decoding shards; routes each new session to the least-loaded one."""
+
+    def __init__(
+        self,
+        model,
+        workers: int = STT_WORKERS,
+        queue_max: int = STT_QUEUE_MAX,
+        backend: str = STT_BACKEND,
+        block_ms: int = STT_BLOCK_MS,
+        resume_grace_s: float = STT_RESUME_GRACE_S,
+        resume_audio_s: float = STT_RESUME_AUDIO_S,
+    ):
+        if backend not in ("thread", "process"):
+            raise ValueError(f"unknown STT_BACKEND {backend!r}")
+        shard_cls      = ProcessShard if backend == "process" else ThreadShard
+        self.queue_max = queue_max
+        self.block_ms  = block_ms
+        self.resume_grace_s = resume_grace_s
+        self.resume_audio_s = resume_audio_s
+        self._parked: dict[str, tuple[SttSession, asyncio.Task]] = {}
+        self._shards   = [shard_cls(i, model) for i in range(max(1, workers))]
+        self._ids      = itertools.count(1)
+        logger.info(f"STT engine started with {len(self._shards)} {backend} shard(s)")
+
+    def _pick_shard(self):
+        for shard in self._shards:
+            if not shard.alive:
+                shard.restart()
+        return min(self._shards, key=lambda s: len(s.sessions))
+
+    async def open_session(self, sample_rate: int, emit: Emit, owner: str | None = None) -> SttSession:
+        shard = self._pick_shard()
+        session = SttSession(self, shard, next(self._ids), emit, owner)
+        shard.sessions.add(session.sid)
+        try:
+            await session.start(sample_rate)
+        except Exception:
+            shard.sessions.discard(session.sid)
+            raise
+        return session
+
+    def park(self, session: SttSession) -> None:
+        """Keep a session whose socket dropped until it is resumed or the grace period ends."""
+        session.detach()
+        expiry = asyncio.create_task(self._expire(session), name=f"stt-parked-{session.sid}")
+        self._parked[session.token] = (session, expiry)
+
+    async def _expire(self, session: SttSession) -> None:
+        await asyncio.sleep(self.resume_grace_s)
+        if self._parked.pop(session.token, None):
+            await session.close()
+
+    async def resume(self, token: str, owner: str | None, emit: Emit) -> SttSession | None:
+        entry = self._parked.get(token)
+        if not entry or entry[0].owner != owner:
+            return None
+        session, expiry = self._parked.pop(token)
+        expiry.cancel()
+        try:
+            await session.attach(emit)
+        except Exception:
+            await session.close()
+            raise
+        return session
+
+    async def release(self, session: SttSession) -> None:
+        session._shard.sessions.discard(session.sid)
+        try:
+            await session._shard.call("close", session.sid)
+        except RuntimeError:
+            pass  # shard died with the recognizer on it
+
+    def shutdown(self) -> None:
+        for _, expiry in self._parked.values():
+            expiry.cancel()
+        self._parked.clear()
+        for shard in self._shards:
+            shard.shutdown()
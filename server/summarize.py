@@ -0,0 +1,353 @@
+"""
+server/summarize.py
+Lecture-note generation for /summarize.
+
+Short transcripts go to the model in one prompt, as before.  Longer ones are
+split on sentence/word boundaries into `SUMMARY_CHUNK_TOKENS`-sized chunks
+(map), each chunk is condensed concurrently – at most `SUMMARY_FANOUT` calls
+in flight per request, `OPENAI_MAX_CONCURRENCY` across the whole process –
+and the partial notes are merged into the usual Markdown outline (reduce).
+If the partial notes are themselves too long they are condensed again, so
+the reduce prompt stays bounded however long the lecture was.
+
+`NotesStream` runs the same pipeline but streams the final pass, fixing up
+flat Key Terms/Action Items lists line by line as the tokens arrive.  Both
+accept the rolling notes of a live session (server/live_notes.py) in place
+of the map phase, leaving only the final merge to do.
+"""
+
+import os, re, asyncio, logging, textwrap, contextlib, unicodedata
+
+from openai import AsyncOpenAI
+
+try:  # exact token counts when available; a chars/4 estimate otherwise
+    import tiktoken
+except Exception:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# ── Settings ────────────────────────────────────────────────────────────────
+SUMMARY_MODEL           = os.getenv("SUMMARY_MODEL", "gpt-4o-mini")
+SUMMARY_CHUNK_TOKENS    = int(os.getenv("SUMMARY_CHUNK_TOKENS", 3000))  # single-pass / chunk limit
+SUMMARY_FANOUT          = int(os.getenv("SUMMARY_FANOUT", 4))           # chunk calls in flight per request
+OPENAI_MAX_CONCURRENCY  = int(os.getenv("OPENAI_MAX_CONCURRENCY", 64))  # all OpenAI calls in flight per process
+SUMMARY_MAP_MAX_TOKENS  = 400   # completion budget per chunk
+SUMMARY_MAX_TOKENS      = 700   # completion budget for the final notes
+PROMPT_VERSION          = 1     # bump on any prompt change: it is part of the cache key
+
+_calls = asyncio.Semaphore(max(1, OPENAI_MAX_CONCURRENCY))
+
+
+# ── Tokens & splitting ──────────────────────────────────────────────────────
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+_encoding = None
+
+
+def load_encoding() -> None:
+    """Blocking (may download the BPE file): run it off the event loop, at startup."""
+    global _encoding
+    if tiktoken is None or _encoding is not None:
+        return
+    try:
+        try:
+            _encoding = tiktoken.encoding_for_model(SUMMARY_MODEL)
+        except KeyError:
+            _encoding = tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken encoding unavailable ({e}); token counts are estimated")
+
+
+def count_tokens(text: str) -> int:
+    if _encoding is None:  # no tiktoken, or not loaded (yet)
+        return len(text) // 4 + 1
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_WORD_RUN = 200  # Vosk output has no punctuation: fall back to runs of words
+
+
+def _pieces(text: str, max_tokens: int):
+    for sentence in _SENTENCE_END.split(text):
+        if count_tokens(sentence) <= max_tokens:
+            yield sentence
+            continue
+        words = sentence.split()
+        for i in range(0, len(words), _WORD_RUN):
+            yield " ".join(words[i:i + _WORD_RUN])
+
+
+def split_transcript(text: str, max_tokens: int = SUMMARY_CHUNK_TOKENS) -> list[str]:
+    """Greedily pack sentences (or word runs) into chunks of at most ~`max_tokens`."""
+    chunks: list[str] = []
+    current: list[str] = []
+    size = 0
+    for piece in _pieces(text.strip(), max_tokens):
+        n = count_tokens(piece) + 1
+        if current and size + n > max_tokens:
+            chunks.append(" ".join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += n
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+# ── Prompts ─────────────────────────────────────────────────────────────────
+_NOTES_PROMPT = textwrap.dedent("""
+    You are an expert lecture note-taker.
+    {intro}
+    Produce **Markdown** with:
+
+    # A top-level title you infer from context (or "Untitled Lecture" if unclear)
+
+    **Date & Time:** {now}
+
+    • A bulleted outline (topic → sub-points)
+    • "Key Terms" and "Action Items" sections
+    • Preserve equations in LaTeX.
+
+    {extra}
+
+    {label}:
+    \"\"\"{source}\"\"\"
+""")
+
+_TRANSCRIPT_INTRO = (
+    "The raw transcript below may contain speech-to-text errors;\n"
+    "correct obvious spelling/grammar mistakes while keeping meaning."
+)
+_NOTES_INTRO = (
+    "The notes below were taken from consecutive parts of one lecture;\n"
+    "merge them into a single set of notes, dropping repetition."
+)
+
+_CHUNK_PROMPT = textwrap.dedent("""
+    You are an expert lecture note-taker.
+    Below is part {part} of {of}{what}.
+    Write concise Markdown bullet notes for this part only:
+    topics with sub-points, any key terms with short definitions, any action items
+    (assignments, deadlines), and equations in LaTeX. No title, no preamble.
+
+    {extra}
+
+    Part {part}:
+    \"\"\"{chunk}\"\"\"
+""")
+
+
+def notes_prompt(source: str, instructions: str, now: str, from_notes: bool = False) -> str:
+    """The final-notes prompt, over either a raw transcript or merged partial notes."""
+    return _NOTES_PROMPT.format(
+        intro=_NOTES_INTRO if from_notes else _TRANSCRIPT_INTRO,
+        now=now,
+        extra=f"Additionally, follow these specific instructions: {instructions}" if instructions else "",
+        label="Partial notes" if from_notes else "Transcript",
+        source=source,
+    )
+
+
+def chunk_prompt(chunk: str, part: int, parts: int | None, instructions: str, of_notes: bool = False) -> str:
+    """`parts` is None while the lecture is still going (live notes)."""
+    return _CHUNK_PROMPT.format(
+        part=part,
+        of=f"{parts} of " if parts else "",
+        what="the notes taken from a lecture" if of_notes
+             else "a raw lecture transcript; it may contain speech-to-text errors",
+        extra=f"Keep in mind these instructions for the final notes: {instructions}" if instructions else "",
+        chunk=chunk,
+    )
+
+
+def restamp(md: str, now: str) -> str:
+    """Replace the **Date & Time:** line of (cached) notes with `now`."""
+    return re.sub(r"^(\*\*Date & Time:\*\*).*$", lambda m: f"{m.group(1)} {now}", md, count=1, flags=re.M)
+
+
+def fix_flat_lists(md: str) -> str:
+    """Turn ‘Key Terms – a – b – c’ into proper bullets."""
+    def _repl(m):
+        title, body = m.group(1), m.group(2)
+        items = [f"- {s.strip()}"    # split on “ - ”
+            for s in re.split(r"\s*-\s+(?!-)", body) if s.strip()]
+        return f"**{title}:**\n" + "\n".join(items) + "\n"
+
+    return re.sub(r"\*\*(Key Terms|Action Items)\*:?\s*(.+)", _repl, md)
+
+
+_FLAT_LIST_HEAD = re.compile(r"\*\*(Key Terms|Action Items)\*:?\s*$")
+
+
+class FlatListFixer:
+    """
+    Streaming `fix_flat_lists`: text passes straight through except lines
+    containing ``*``, which are held until they are complete (and, for a bare
+    heading, until the line after it) so the fix-up sees what it would have
+    seen in the finished Markdown.
+    """
+
+    def __init__(self):
+        self._held: str | None = ""  # None: the current line is already streaming
+
+    def feed(self, text: str) -> str:
+        out = []
+        for part in re.split(r"(?<=\n)", text):
+            if not part:
+                continue
+            if self._held is None:
+                out.append(part)
+                if part.endswith("\n"):
+                    self._held = ""
+                continue
+            line = self._held + part
+            if line.endswith("\n") and not _FLAT_LIST_HEAD.search(line):
+                out.append(fix_flat_lists(line))
+                self._held = ""
+            elif "*" in line:
+                self._held = line
+            else:
+                out.append(line)
+                self._held = None
+        return "".join(out)
+
+    def flush(self) -> str:
+        held, self._held = self._held or "", ""
+        return fix_flat_lists(held)
+
+
+# ── Map / reduce ────────────────────────────────────────────────────────────
+async def complete(
+    client: AsyncOpenAI, prompt: str, max_tokens: int,
+    fanout: asyncio.Semaphore | None = None, calls: asyncio.Semaphore | None = None,
+) -> tuple[str, int]:
+    """One completion; `fanout` bounds the calls of one request, `calls` (default: `_calls`) a whole pool."""
+    async with fanout or contextlib.nullcontext(), calls or _calls:
+        chat = await client.chat.completions.create(
+            model=SUMMARY_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.3,
+            max_tokens=max_tokens,
+        )
+    return chat.choices[0].message.content.strip(), chat.usage.total_tokens if chat.usage else 0
+
+
+async def _map(
+    client: AsyncOpenAI, chunks: list[str], instructions: str, fanout: asyncio.Semaphore, of_notes: bool = False
+) -> tuple[list[str], int]:
+    results = await asyncio.gather(*(
+        complete(client, chunk_prompt(chunk, i, len(chunks), instructions, of_notes), SUMMARY_MAP_MAX_TOKENS, fanout)
+        for i, chunk in enumerate(chunks, 1)
+    ))
+    return [notes for notes, _ in results], sum(tokens for _, tokens in results)
+
+
+def _group(notes: list[str], max_tokens: int = SUMMARY_CHUNK_TOKENS) -> list[str]:
+    """Pack consecutive partial notes into groups that fit one prompt."""
+    groups: list[list[str]] = [[]]
+    size = 0
+    for note in notes:
+        n = count_tokens(note)
+        if groups[-1] and size + n > max_tokens:
+            groups.append([])
+            size = 0
+        groups[-1].append(note)
+        size += n
+    return ["\n\n".join(group) for group in groups]
+
+
+async def reduce_notes(
+    client: AsyncOpenAI, notes: list[str], instructions: str, fanout: asyncio.Semaphore
+) -> tuple[str, int]:
+    """
+    Condense partial notes (in order) until they fit in one reduce prompt.
+    Each round packs ~`SUMMARY_CHUNK_TOKENS` of notes into one call that
+    answers with at most `SUMMARY_MAP_MAX_TOKENS`, so the rounds shrink fast.
+    """
+    tokens = 0
+    while len(notes) > 1 and count_tokens("\n\n".join(notes)) > SUMMARY_CHUNK_TOKENS:
+        notes, more = await _map(client, _group(notes), instructions, fanout, of_notes=True)
+        tokens += more
+    return "\n\n".join(notes), tokens
+
+
+async def condense(
+    client: AsyncOpenAI, transcript: str, instructions: str, fanout: asyncio.Semaphore
+) -> tuple[str | None, int]:
+    """
+    Map a long transcript to partial notes that fit in one reduce prompt.
+    Returns (notes, tokens used); notes is None when the transcript is short
+    enough to summarize directly.
+    """
+    if count_tokens(transcript) <= SUMMARY_CHUNK_TOKENS:
+        return None, 0
+    chunks = split_transcript(transcript)
+    notes, tokens = await _map(client, chunks, instructions, fanout)
+    logger.info(f"Summarized {len(chunks)} transcript chunks ({tokens} tokens)")
+    merged, more = await reduce_notes(client, notes, instructions, fanout)
+    return merged, tokens + more
+
+
+async def _prepare(client: AsyncOpenAI, transcript: str, instructions: str, live) -> tuple[str | None, int]:
+    fanout = asyncio.Semaphore(max(1, SUMMARY_FANOUT))  # this request's share of the calls
+    if live is not None:  # the map phase already ran while the lecture was recorded
+        return await live.condense(instructions, fanout)
+    return await condense(client, transcript, instructions, fanout)
+
+
+async def summarize_transcript(
+    client: AsyncOpenAI, transcript: str, instructions: str, now: str, live=None
+) -> tuple[str, int]:
+    """Markdown lecture notes for `transcript`; returns (markdown, total tokens used)."""
+    notes, tokens = await _prepare(client, transcript, instructions, live)
+    prompt = notes_prompt(notes or transcript, instructions, now, from_notes=notes is not None)
+    md, more = await complete(client, prompt, SUMMARY_MAX_TOKENS)
+    return fix_flat_lists(md), tokens + more
+
+
+class NotesStream:
+    """
+    Async iterator over Markdown deltas of the notes for `transcript`.  Long
+    transcripts are condensed first (not streamed); once exhausted,
+    `.markdown` holds the finished notes and `.tokens` the total tokens used.
+    """
+
+    def __init__(self, client: AsyncOpenAI, transcript: str, instructions: str, now: str, live=None):
+        self.client       = client
+        self.transcript   = transcript
+        self.instructions = instructions
+        self.now          = now
+        self.live         = live
+        self.markdown     = ""
+        self.tokens       = 0
+
+    async def __aiter__(self):
+        notes, self.tokens = await _prepare(self.client, self.transcript, self.instructions, self.live)
+        prompt = notes_prompt(notes or self.transcript, self.instructions, self.now, from_notes=notes is not None)
+        fixer, parts, text_started = FlatListFixer(), [], False
+        async with _calls:
+            stream = await self.client.chat.completions.create(
+                model=SUMMARY_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.3,
+                max_tokens=SUMMARY_MAX_TOKENS,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            async for chunk in stream:
+                if chunk.usage:
+                    self.tokens += chunk.usage.total_tokens
+                if chunk.choices and (delta := chunk.choices[0].delta.content):
+                    parts.append(delta)
+                    if not text_started:  # match the .strip() of the non-streamed notes
+                        delta = delta.lstrip()
+                        text_started = bool(delta)
+                    if out := fixer.feed(delta):
+                        yield out
+        if out := fixer.flush():
+            yield out
+        self.markdown = fix_flat_lists("".join(parts).strip())
@@ -0,0 +1,133 @@
+"""
+server/summary_cache.py
+Content-addressed cache of generated notes.
+
+The key is a SHA-256 over the normalized transcript and custom instructions,
+the model and the prompt version, so a retry of the same request is served
+without an OpenAI call (and without spending quota), while any change to the
+prompts or model naturally misses.  Backends (`SUMMARY_CACHE`):
+
+* ``memory``   – per-process LRU of `SUMMARY_CACHE_MAX` entries (default).
+* ``postgres`` – the `summary_cache` table, shared by all workers.
+* ``off``      – no caching.
+
+Entries expire after `SUMMARY_CACHE_TTL_S`.  Cache failures are logged and
+treated as misses; they never fail a /summarize call.
+"""
+
+import os, time, hashlib, logging, datetime
+from collections import OrderedDict
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+
+from server.db import AsyncSessionLocal
+from server.metrics import Counter, Gauge
+from server.models import SummaryCacheEntry
+from server.summarize import PROMPT_VERSION, SUMMARY_MODEL, normalize_text
+
+logger = logging.getLogger(__name__)
+
+# ── Settings ────────────────────────────────────────────────────────────────
+SUMMARY_CACHE       = os.getenv("SUMMARY_CACHE", "memory")        # "memory" | "postgres" | "off"
+SUMMARY_CACHE_MAX   = int(os.getenv("SUMMARY_CACHE_MAX", 512))     # entries (memory backend)
+SUMMARY_CACHE_TTL_S = int(os.getenv("SUMMARY_CACHE_TTL_S", 86400))
+
+LOOKUPS = Counter("summary_cache_lookups_total", "Summary cache lookups by result (hit/miss/error).")
+
+
+def summary_key(transcript: str, instructions: str) -> str:
+    h = hashlib.sha256()
+    for part in (f"v{PROMPT_VERSION}", SUMMARY_MODEL, normalize_text(instructions), normalize_text(transcript)):
+        h.update(part.encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class MemorySummaryCache:
+    def __init__(self, max_entries: int = SUMMARY_CACHE_MAX, ttl_s: int = SUMMARY_CACHE_TTL_S):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        Gauge("summary_cache_entries", "Entries in the in-memory summary cache.", lambda: len(self._entries))
+
+    async def get(self, key: str) -> str | None:
+        entry = self._entries.get(key)
+        if not entry:
+            return None
+        outline, expires = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return outline
+
+    async def put(self, key: str, outline: str) -> None:
+        self._entries[key] = (outline, time.monotonic() + self.ttl_s)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class PostgresSummaryCache:
+    PURGE_EVERY = 100  # puts between sweeps of expired rows
+
+    def __init__(self, ttl_s: int = SUMMARY_CACHE_TTL_S):
+        self.ttl_s = ttl_s
+        self._puts = 0
+
+    async def get(self, key: str) -> str | None:
+        async with AsyncSessionLocal() as db:
+            return await db.scalar(
+                select(SummaryCacheEntry.outline).where(
+                    SummaryCacheEntry.key == key,
+                    SummaryCacheEntry.expires_at > datetime.datetime.now(datetime.timezone.utc),
+                )
+            )
+
+    async def put(self, key: str, outline: str) -> None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        expires = now + datetime.timedelta(seconds=self.ttl_s)
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                insert(SummaryCacheEntry)
+                .values(key=key, outline=outline, expires_at=expires)
+                .on_conflict_do_update(index_elements=["key"], set_={"outline": outline, "expires_at": expires})
+            )
+            self._puts += 1
+            if self._puts % self.PURGE_EVERY == 0:
+                await db.execute(delete(SummaryCacheEntry).where(SummaryCacheEntry.expires_at <= now))
+            await db.commit()
+
+
+class SummaryCache:
+    """Front for the configured backend: counts lookups and swallows backend errors."""
+
+    def __init__(self, backend: str = SUMMARY_CACHE):
+        if backend not in ("memory", "postgres", "off"):
+            raise ValueError(f"unknown SUMMARY_CACHE {backend!r}")
+        self.backend = {
+            "memory": MemorySummaryCache,
+            "postgres": PostgresSummaryCache,
+            "off": lambda: None,
+        }[backend]()
+
+    async def get(self, key: str) -> str | None:
+        if self.backend is None:
+            return None
+        try:
+            outline = await self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Summary cache lookup failed: {e}")
+            LOOKUPS.inc(result="error")
+            return None
+        LOOKUPS.inc(result="hit" if outline is not None else "miss")
+        return outline
+
+    async def put(self, key: str, outline: str) -> None:
+        if self.backend is None:
+            return
+        try:
+            await self.backend.put(key, outline)
+        except Exception as e:
+            logger.warning(f"Summary cache store failed: {e}")
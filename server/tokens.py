@@ -0,0 +1,59 @@
+"""
+server/tokens.py
+Cache of already verified access tokens.
+
+Every authenticated request carries the same cookie JWT, and several
+dependencies (`get_current_user_from_cookie`, `quota.current_user_context`,
+/ws/stt) used to run `jwt.decode` – signature check included – on it
+independently.  `verify_token()` now looks the token up here first: a token
+whose signature was checked once is trusted until its `exp`, so a user's
+follow-up requests skip the decode entirely.  Within one request the subject
+is also kept on `request.state`.
+
+The cache is a per-process LRU of `JWT_CACHE_MAX` tokens.  Only tokens with
+an `exp` are cached, never past it; after changing `JWT_SECRET_KEY`, restart
+the workers so tokens signed with the old key are forgotten.
+"""
+
+import os, time
+from collections import OrderedDict
+
+from server.metrics import Counter, Gauge
+
+# ── Settings ────────────────────────────────────────────────────────────────
+JWT_CACHE_MAX = int(os.getenv("JWT_CACHE_MAX", 4096))  # tokens; 0 turns the cache off
+
+LOOKUPS = Counter("jwt_cache_lookups_total", "Verified-token cache lookups by result (hit/miss).")
+
+
+class VerifiedTokens:
+    def __init__(self, max_entries: int = JWT_CACHE_MAX):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, dict] = OrderedDict()  # token → claims
+
+    def get(self, token: str) -> dict | None:
+        claims = self._entries.get(token)
+        if claims is not None and claims["exp"] <= time.time():
+            del self._entries[token]
+            claims = None
+        if claims is None:
+            LOOKUPS.inc(result="miss")
+            return None
+        self._entries.move_to_end(token)
+        LOOKUPS.inc(result="hit")
+        return claims
+
+    def put(self, token: str, claims: dict) -> None:
+        if self.max_entries <= 0 or not isinstance(claims.get("exp"), (int, float)):
+            return
+        self._entries[token] = claims
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+verified_tokens = VerifiedTokens()
+Gauge("jwt_cache_entries", "Tokens in the verified-token cache.", lambda: len(verified_tokens))
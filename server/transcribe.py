@@ -0,0 +1,224 @@
+"""
+server/transcribe.py
+Offline transcription jobs for uploaded recordings (/transcribe).
+
+An upload is spooled to disk, converted to 16 kHz mono PCM, cut at pauses
+into 10–45 s segments and decoded in parallel on `TRANSCRIBE_WORKERS`
+recognizers that all share the already-loaded Vosk model.  Word timestamps
+are shifted by each segment's offset and stitched back in order.
+
+Each user may have `TRANSCRIBE_MAX_JOBS_PER_USER` jobs unfinished at once,
+holding at most `TRANSCRIBE_MAX_USER_MB` of uploads between them, so one
+account can't fill the spool disk.
+"""
+
+import os, json, time, wave, uuid, asyncio, logging, tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+from vosk import KaldiRecognizer
+
+from server.audio import Resampler, check_rate, split_at_silence
+from server.stt import STT_MODEL_RATE as MODEL_RATE
+
+logger = logging.getLogger(__name__)
+
+# ── Settings ────────────────────────────────────────────────────────────────
+TRANSCRIBE_WORKERS   = int(os.getenv("TRANSCRIBE_WORKERS", os.cpu_count() or 4))
+TRANSCRIBE_MAX_BYTES = int(os.getenv("TRANSCRIBE_MAX_MB", 1024)) * 1024 * 1024
+TRANSCRIBE_JOB_TTL_S = int(os.getenv("TRANSCRIBE_JOB_TTL_S", 3600))  # keep results this long
+TRANSCRIBE_MAX_JOBS_PER_USER = int(os.getenv("TRANSCRIBE_MAX_JOBS_PER_USER", 3))           # unfinished, then 429
+TRANSCRIBE_MAX_USER_BYTES    = int(os.getenv("TRANSCRIBE_MAX_USER_MB", 2048)) * 1024 * 1024  # across them, then 413
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+class TooManyJobs(Exception):
+    pass
+
+
+@dataclass
+class TranscribeJob:
+    id: str
+    owner: str
+    path: str
+    status: str = "receiving"          # receiving → queued → running → done | error
+    received: int = 0
+    segments_total: int = 0
+    segments_done: int = 0
+    text: str = ""
+    words: list[dict] = field(default_factory=list)
+    error: str | None = None
+    created: float = field(default_factory=time.monotonic)
+
+    def public(self) -> dict:
+        out = {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": self.segments_done / self.segments_total if self.segments_total else 0.0,
+        }
+        if self.status == "done":
+            out.update(text=self.text, words=self.words)
+        if self.error:
+            out["error"] = self.error
+        return out
+
+
+# ── Blocking helpers (run on the executor) ─────────────────────────────────
+def _to_model_pcm(src_path: str, dst_path: str, sample_rate: int | None) -> None:
+    """Convert a WAV or raw 16-bit mono upload to 16 kHz mono PCM on disk."""
+    with open(src_path, "rb") as f:
+        is_wav = f.read(4) == b"RIFF"
+
+    if is_wav:
+        src = wave.open(src_path, "rb")
+        if src.getsampwidth() != 2:
+            src.close()
+            raise ValueError("Only 16-bit PCM WAV files are supported.")
+        try:
+            rate = check_rate(src.getframerate())
+        except ValueError:
+            src.close()
+            raise
+        channels, read = src.getnchannels(), src.readframes
+    else:
+        if not sample_rate:
+            raise ValueError("sample_rate is required for raw PCM uploads.")
+        rate, channels = check_rate(sample_rate), 1
+        src = open(src_path, "rb")
+        read = lambda n: src.read(n * 2)
+
+    resampler = Resampler(rate, MODEL_RATE)
+    with src, open(dst_path, "wb") as dst:
+        while block := read(rate):  # one second at a time
+            pcm = np.frombuffer(block[:len(block) // (2 * channels) * 2 * channels], dtype="<i2")
+            if channels > 1:
+                pcm = pcm.reshape(-1, channels).mean(axis=1).astype("<i2")
+            dst.write(resampler.process(pcm.tobytes()))
+
+
+def _append(path: str, data: bytes) -> None:
+    with open(path, "ab") as f:
+        f.write(data)
+
+
+def _decode_segment(model, pcm: np.ndarray, offset_s: float) -> tuple[str, list[dict]]:
+    rec = KaldiRecognizer(model, MODEL_RATE)
+    rec.SetWords(True)
+    results = []
+    step = MODEL_RATE * 4
+    for i in range(0, len(pcm), step):
+        if rec.AcceptWaveform(pcm[i:i + step].tobytes()):
+            results.append(json.loads(rec.Result()))
+    results.append(json.loads(rec.FinalResult()))
+
+    words = [
+        {**w, "start": round(w["start"] + offset_s, 2), "end": round(w["end"] + offset_s, 2)}
+        for r in results for w in r.get("result", [])
+    ]
+    return " ".join(r["text"] for r in results if r.get("text")), words
+
+
+# ── Service ─────────────────────────────────────────────────────────────────
+class Transcriber:
+    def __init__(self, model, workers: int = TRANSCRIBE_WORKERS):
+        self.model = model
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="transcribe")
+        self._jobs: dict[str, TranscribeJob] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def _purge(self) -> None:
+        now = time.monotonic()
+        for job_id, job in list(self._jobs.items()):
+            if job.status in ("done", "error") and now - job.created > TRANSCRIBE_JOB_TTL_S:
+                del self._jobs[job_id]
+
+    def _unfinished(self, owner: str) -> list[TranscribeJob]:
+        return [j for j in self._jobs.values() if j.owner == owner and j.status not in ("done", "error")]
+
+    def new_job(self, owner: str) -> TranscribeJob:
+        self._purge()
+        if len(self._unfinished(owner)) >= TRANSCRIBE_MAX_JOBS_PER_USER:
+            raise TooManyJobs(f"At most {TRANSCRIBE_MAX_JOBS_PER_USER} transcriptions at a time; wait for one to finish.")
+        fd, path = tempfile.mkstemp(prefix="lab12-upload-", suffix=".bin")
+        os.close(fd)
+        job = TranscribeJob(id=uuid.uuid4().hex, owner=owner, path=path)
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str, owner: str) -> TranscribeJob | None:
+        job = self._jobs.get(job_id)
+        return job if job and job.owner == owner else None
+
+    async def append(self, job: TranscribeJob, data: bytes) -> None:
+        job.received += len(data)
+        if job.received > TRANSCRIBE_MAX_BYTES:
+            self.discard(job)
+            raise UploadTooLarge(f"Upload exceeds {TRANSCRIBE_MAX_BYTES // (1024 * 1024)} MB.")
+        if sum(j.received for j in self._unfinished(job.owner)) > TRANSCRIBE_MAX_USER_BYTES:
+            self.discard(job)
+            raise UploadTooLarge(
+                f"Your unfinished transcriptions exceed {TRANSCRIBE_MAX_USER_BYTES // (1024 * 1024)} MB."
+            )
+        # default executor: the decode threads may all be busy with other jobs
+        await asyncio.get_running_loop().run_in_executor(None, _append, job.path, data)
+
+    def discard(self, job: TranscribeJob) -> None:
+        self._jobs.pop(job.id, None)
+        _unlink(job.path)
+
+    def submit(self, job: TranscribeJob, sample_rate: int | None = None) -> None:
+        job.status = "queued"
+        task = asyncio.create_task(self._run(job, sample_rate), name=f"transcribe-{job.id}")
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job: TranscribeJob, sample_rate: int | None) -> None:
+        loop = asyncio.get_running_loop()
+        pcm_path = job.path + ".pcm"
+        started = time.monotonic()
+        try:
+            job.status = "running"
+            await loop.run_in_executor(self._executor, _to_model_pcm, job.path, pcm_path, sample_rate)
+            if not os.path.getsize(pcm_path):
+                raise ValueError("Upload contains no audio.")
+            pcm = np.memmap(pcm_path, dtype="<i2", mode="r")
+            segments = await loop.run_in_executor(self._executor, split_at_silence, pcm, MODEL_RATE)
+            job.segments_total = len(segments)
+
+            async def decode(start: int, end: int):
+                out = await loop.run_in_executor(
+                    self._executor, _decode_segment, self.model, pcm[start:end], start / MODEL_RATE
+                )
+                job.segments_done += 1
+                return out
+
+            parts = await asyncio.gather(*(decode(a, b) for a, b in segments))
+            job.text  = " ".join(text for text, _ in parts if text)
+            job.words = [w for _, words in parts for w in words]
+            job.status = "done"
+            logger.info(
+                f"Transcribed {len(pcm) / MODEL_RATE:.0f}s of audio for {job.owner} "
+                f"in {time.monotonic() - started:.1f}s ({len(segments)} segments)"
+            )
+        except (ValueError, wave.Error) as e:
+            job.status, job.error = "error", str(e)
+        except Exception as e:
+            logger.error(f"Transcription job {job.id} failed: {e}", exc_info=True)
+            job.status, job.error = "error", "Transcription failed."
+        finally:
+            _unlink(job.path)
+            _unlink(pcm_path)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _unlink(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
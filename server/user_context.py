@@ -0,0 +1,125 @@
+"""
+server/user_context.py
+Who the caller is, loaded once: user row + role names in a single query.
+
+Contexts are immutable snapshots kept in a process-wide cache for
+`USER_CONTEXT_TTL_S`, so authenticated hot paths (/summarize, /me/quota …)
+usually skip the database entirely.  (Summarize calls charged since a
+snapshot was loaded are added on top by the quota ledger, see `loaded_at`.)  Entries are dropped early when:
+
+* this process changes the user – `invalidate()`;
+* anything changes a user's roles or plan – Postgres triggers (see the
+  `user_context_notify` migration) send NOTIFY on `USER_CONTEXT_CHANNEL`,
+  which every worker LISTENs to.  That covers `grant_admin.py` and manual
+  plan changes made straight in SQL.
+"""
+
+import os, time, asyncio, logging
+from dataclasses import dataclass, field
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import joinedload
+
+from server.models import User
+
+logger = logging.getLogger(__name__)
+
+USER_CONTEXT_TTL_S   = float(os.getenv("USER_CONTEXT_TTL_S", 30))
+USER_CONTEXT_CHANNEL = "user_context"  # NOTIFY payload: the user id
+
+
+@dataclass(frozen=True)
+class UserContext:
+    id: int
+    username: str
+    full_name: str | None
+    subscription_plan: str
+    summarize_call_count: int
+    roles: frozenset[str]
+    loaded_at: float = field(default=0.0, compare=False)  # monotonic, taken before the query
+
+    @property
+    def is_admin(self) -> bool:
+        return "admin" in self.roles
+
+
+_cache: dict[str, tuple[UserContext, float]] = {}
+
+
+async def load_user_context(db: AsyncSession, username: str) -> UserContext | None:
+    hit = _cache.get(username)
+    if hit and hit[1] > time.monotonic():
+        return hit[0]
+
+    started = time.monotonic()
+    res = await db.execute(
+        select(User).options(joinedload(User.roles)).where(User.username == username)
+    )
+    user = res.unique().scalar_one_or_none()
+    if user is None:
+        _cache.pop(username, None)
+        return None
+    ctx = UserContext(
+        id=user.id,
+        username=user.username,
+        full_name=user.full_name,
+        subscription_plan=user.subscription_plan,
+        summarize_call_count=user.summarize_call_count or 0,
+        roles=frozenset(role.name for role in user.roles),
+        loaded_at=started,
+    )
+    _cache[username] = (ctx, time.monotonic() + USER_CONTEXT_TTL_S)
+    return ctx
+
+
+def invalidate(username: str | None = None, user_id: int | None = None) -> None:
+    if username is not None:
+        _cache.pop(username, None)
+    if user_id is not None:
+        for name, (ctx, _) in list(_cache.items()):
+            if ctx.id == user_id:
+                _cache.pop(name, None)
+
+
+class InvalidationListener:
+    """Holds one pooled connection LISTENing on `USER_CONTEXT_CHANNEL`."""
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._listen(), name="user-context-listener")
+
+    async def _listen(self) -> None:
+        def on_notify(_conn, _pid, _channel, payload: str) -> None:
+            try:
+                invalidate(user_id=int(payload))
+            except ValueError:
+                _cache.clear()
+
+        while True:
+            try:
+                async with self.engine.connect() as conn:
+                    raw = (await conn.get_raw_connection()).driver_connection
+                    lost = asyncio.get_running_loop().create_future()
+                    raw.add_termination_listener(lambda _conn: lost.done() or lost.set_result(None))
+                    await raw.add_listener(USER_CONTEXT_CHANNEL, on_notify)
+                    try:
+                        _cache.clear()  # changes may have been missed while we weren't listening
+                        await lost
+                    finally:
+                        if not raw.is_closed():
+                            await raw.remove_listener(USER_CONTEXT_CHANNEL, on_notify)
+                logger.warning("User context listener lost its connection; reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"User context listener failed ({e}); retrying")
+                await asyncio.sleep(5)
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
@@ -0,0 +1,37 @@
+const GOOGLE_CLIENT_ID = "1024744015168-0nni6g7fg6q425lueq3s5ii98s85slek.apps.googleusercontent.com";
+const GOOGLE_DRIVE_SCOPES = "https://www.googleapis.com/auth/drive.file";
+
+// 2) A robust updater that looks up DOM/globals at call time
+window.updateGDriveButtonState = function () {
+  const btn = document.getElementById("save-gdrive-btn");
+  if (!btn) return;
+  const ready = !!(window.googleTokenClient && window.pickerApiLoaded);
+  const notesExist = !!(window.notesMD && window.notesMD.trim());
+  const enabled = ready && !!window.currentUser && notesExist;
+  btn.disabled = !enabled;
+  btn.classList.toggle("hidden", !enabled);
+};
+
+function onGoogleGsiLoad() {
+  window.googleTokenClient = google.accounts.oauth2.initTokenClient({
+    client_id: GOOGLE_CLIENT_ID,
+    scope: GOOGLE_DRIVE_SCOPES,
+    // wrap so it always calls the *current* global handler
+    callback: resp => window.handleGoogleTokenResponse(resp)
+  });
+  // console.log("onGoogleGsiLoad fired. Client:", window.googleTokenClient);
+  window.gisInited = true;
+  window.updateGDriveButtonState();
+}
+
+// GSI calls this global once it has loaded (the CSP rules out an inline onload=)
+window.onGoogleLibraryLoad = onGoogleGsiLoad;
+
+function onGoogleApiLoad() {
+  gapi.load("picker", () => {
+    // console.log("gapi.load('picker') callback fired."); // Add this log
+    window.pickerApiLoaded = true; // Make sure this line exists and is correct
+    // console.log("onGoogleApiLoad -> picker loaded. Flag:", window.pickerApiLoaded); // Log *after* setting
+    window.updateGDriveButtonState(); // Update state *after* flag is set
+  });
+}